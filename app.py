@@ -4,22 +4,130 @@ Starshield Network Monitor
 Clean Python implementation with interface selection
 """
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, make_response, Response
 import subprocess
-import json
 import time
 import threading
+import atexit
+import math
+import socket
+from concurrent.futures import ThreadPoolExecutor, wait
 import psutil
 from datetime import datetime, timedelta
 import os
 import requests
 from ping3 import ping
+from icmp_sweep import HostResolver, open_prober, fit_serialization_delay
+from ping_workers import PingWorkerPool
+from history import RingBuffer
+from tsdb import TimeSeriesStore
+from rollups import Rollups
+from quantiles import WindowedSketch
+from iface_rates import RateSampler
+from iface_inventory import InterfaceInventory
+from push import Broadcaster, encode_event, KEEPALIVE_INTERVAL
+from snapshots import EncodedPayload, StatusSnapshot
+from state import StateStore
+from scheduler import Scheduler
+from speed_jobs import SpeedTestRunner
+from iperf import discover_iperf3, rank_servers, run_client, find_saturation
+import throughput
+import http_speed
+from packet_train import BandwidthTracker, TrainServer, run_train
+from probe_rate import ProbeRateController
 import random
 
 app = Flask(__name__)
 
-# Global monitoring data
-monitoring_data = {
+# Probe engine settings
+PROBE_DEADLINE = 4  # Seconds a tick waits for all probes to answer
+PROBE_WORKERS = 16  # Upper bound on probes in flight at once
+PING_FALLBACK = 'stream'  # 'stream' keeps one ping -i per target, 'fork' runs ping -c 1 per sample
+PING_STREAM_INTERVAL = 1  # Seconds between echoes of a streaming ping worker
+
+# Performance history settings
+HISTORY_CAPACITY = 3 * 24 * 3600  # Three days of 1 second samples
+HISTORY_API_ENTRIES = 100  # Newest samples included in /api/status
+
+# On-disk time-series store
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+HISTORY_QUERY_LIMIT = 100000  # Most records returned by one /api/history call
+RAW_RETENTION = 30 * 24 * 3600  # Raw probe samples on disk older than this expire
+
+# Metrics folded into the 1 s / 1 min / 1 h / 1 day rollup tiers
+ROLLUP_METRICS = ('latency', 'dns_latency', 'bandwidth')
+PERCENTILE_WINDOW = 300  # Seconds per latency percentile window
+
+# Interface counters are sampled this often (down to 0.1 s) to compute rates
+RATE_SAMPLE_INTERVAL = 1.0
+INVENTORY_POLL_INTERVAL = 5  # Interface refresh interval where netlink is unavailable
+
+# iperf3 speed tests
+IPERF_SERVERS = [
+    # Add your AWS EC2 iperf3 server here for best results
+    # {'host': 'YOUR_AWS_EC2_IP', 'port': 5201},
+    
+    # Public iperf3 servers (fallback)
+    {'host': 'iperf.par2.as49434.net', 'port': 5201},
+    {'host': 'iperf.biznetnetworks.com', 'port': 5201},
+    {'host': 'iperf.he.net', 'port': 5201},
+    {'host': 'speedtest.serverius.net', 'port': 5002},
+]
+IPERF_BEST_SERVERS = 2  # Full tests run against this many of the lowest-latency servers
+SERVER_PROBE_TIMEOUT = 2  # Seconds for the RTT / TCP connect pre-probe
+IPERF_MAX_SECONDS = 10  # Longest run per server and direction
+IPERF_CONVERGENCE_TOLERANCE = 0.05  # Stop once 3 consecutive seconds are within 5% of their mean
+
+# Built-in throughput engine (throughput.py): our own endpoints, tried before iperf3
+THROUGHPUT_SERVERS = [
+    # {'host': 'YOUR_ENDPOINT_IP', 'port': throughput.DEFAULT_PORT},
+]
+THROUGHPUT_SERVER_PORT = None  # Also serve throughput tests from this monitor on this port
+
+# HTTP fallback test: large bodies streamed over pooled, parallel connections
+HTTP_TEST_URLS = [
+    'https://httpbin.org/bytes/1048576',  # 1MB file
+    'https://httpbin.org/bytes/2097152',  # 2MB file
+    'https://httpbin.org/bytes/5242880',  # 5MB file
+]
+HTTP_TEST_CONNECTIONS = 1  # Parallel connections per URL; each one downloads the whole body
+HTTP_TEST_MAX_SECONDS = 10  # Stop reading a URL after this long
+HTTP_UPLOAD_URL = 'https://speed.cloudflare.com/__up'  # Accepts and discards POSTed bodies
+HTTP_UPLOAD_BYTES = 25 * 1024 * 1024  # Upload volume, split across the connections (MBs to GBs)
+HTTP_UPLOAD_SINK_PORT = None  # Also accept HTTP upload tests on this port (http_speed.SinkServer)
+
+# Ping fallback: RTT against ICMP payload size to the gateway
+PING_SWEEP_SIZES = (56, 256, 512, 1024, 1472)  # Payload bytes; 1472 fills a 1500-byte MTU
+PING_SWEEP_COUNT = 5  # Echoes per size; the fastest one is free of queueing
+PING_SWEEP_TIMEOUT = 0.2  # Seconds to wait for each size's replies
+
+# Packet-train estimator (packet_train.py): tracks bandwidth between full speed tests
+PACKET_TRAIN_SERVER = None  # e.g. {'host': 'YOUR_ENDPOINT_IP', 'port': 5302}
+PACKET_TRAIN_SERVER_PORT = None  # Also answer packet trains from this monitor on this port
+PACKET_TRAIN_INTERVAL = 5  # Seconds between trains (about 40 KB each way per run)
+PACKET_TRAIN_COUNT = 32  # Packets per train
+PACKET_TRAIN_SIZE = 1200  # UDP payload bytes per packet
+SPEED_TEST_CALIBRATION_INTERVAL = 3600  # Full speed test interval while trains track the link
+
+# Saturation mode: parallel streams (-P) to several servers at once
+IPERF_SATURATION_SERVERS = 2  # Servers loaded at the same time
+IPERF_STREAM_LADDER = (1, 2, 4, 8)  # Streams per server tried in turn
+IPERF_MIN_STREAM_GAIN = 0.1  # Stop adding streams once a step gains less than 10%
+
+# Recurring jobs (seconds)
+MONITOR_INTERVAL = 5  # Starting interval of the monitor ticks (adapted by probe_rate)
+PROBE_MIN_INTERVAL = 0.5  # Fastest ticks, while latency jumps, echoes go missing or interfaces change
+PROBE_MAX_INTERVAL = 10  # Slowest ticks, reached by backing off while the link is calm
+PROBE_HOLD_SECONDS = 30  # Calm time before backing off again
+PROBE_TARGET_PPS = 2  # Echoes per second each target may get
+PROBE_PPS_BUDGETS = {}  # Per-host overrides, e.g. {'198.51.100.7': 0.2}
+SPEED_TEST_INTERVAL = 180  # On wall-clock multiples, i.e. every 3 minutes on the minute
+SPEED_TEST_JITTER = 15  # Random start delay so many monitors don't hit the servers together
+RETENTION_INTERVAL = 60  # Expire old samples and rollup buckets on disk
+FLUSH_INTERVAL = 30  # Write mapped segments back to disk
+
+# Global monitoring data (initial values; see monitoring_state)
+initial_state = {
     'selected_interface': 'Ethernet 4',
     'available_interfaces': [],
     'gateway': '100.64.0.1',
@@ -27,7 +135,7 @@ monitoring_data = {
     'status': 'unknown',
     'latency': 0,
     'dns_latency': 0,
-    'bandwidth': {'rx': 0, 'tx': 0},
+    'bandwidth': {'rx': 0, 'tx': 0, 'rx_mbps': 0, 'tx_mbps': 0},
     'uptime': 0,
     'last_check': None,
     'interface_found': False,
@@ -40,12 +148,98 @@ monitoring_data = {
     'fast_com_speed': None,
     'last_fast_com_test': None,
     'downtime_count': 0,
-    'performance_history': []
+    
+    # Extra hops, PoPs and customer edges probed every tick
+    'probe_targets': [],
+    'target_latency': {},
+    'ping_workers': {},
+    'probe_rate': {},
+    'latency_percentiles': {},
+    
+    # Packet-train bandwidth estimate per direction (see bandwidth_tracker)
+    'link_estimate': {},
+    
+    # Per-interface state for every monitored interface
+    'interfaces': {}
 }
 
-def get_all_interfaces():
-    """Get all available network interfaces"""
-    interfaces = psutil.net_if_addrs()
+# Copy-on-write state: the monitor thread, the scheduler and request handlers
+# publish new versions; readers use monitoring_state.current without locking
+monitoring_state = StateStore(initial_state)
+
+# Push channel for dashboards (Server-Sent Events)
+broadcaster = Broadcaster()
+
+# Versions and history cursors restart at 0 with the process, so clients send
+# this back with them and tokens from another run get a full payload
+STATE_EPOCH = str(int(time.time() * 1000))
+
+# Pre-serialized payloads of the latest published version
+status_snapshot = None
+publish_lock = threading.Lock()
+
+def publish_state():
+    """Encode the newest state version once and push its delta to subscribers"""
+    global status_snapshot
+    with publish_lock:
+        state = monitoring_state.current
+        previous = status_snapshot
+        if previous is not None and previous.version >= state.version:
+            return previous
+        
+        # Full payload for new clients, delta for clients one version behind
+        full = build_status_payload(state)
+        if previous is not None:
+            snapshot = StatusSnapshot(
+                state.version, full['history_cursor'], full,
+                build_status_payload(state, previous.version, previous.history_cursor),
+                previous.version, previous.history_cursor, STATE_EPOCH
+            )
+        else:
+            snapshot = StatusSnapshot(state.version, full['history_cursor'], full, epoch=STATE_EPOCH)
+        status_snapshot = snapshot
+        
+        # Published under the lock so subscribers get deltas in version order
+        if snapshot.delta is not None:
+            broadcaster.publish('status', snapshot.delta.body, snapshot.version)
+    return snapshot
+
+def update_state(changes):
+    """Publish a new state version (see StateStore.update) and return it"""
+    state = monitoring_state.update(changes)
+    publish_state()
+    return state
+
+# Columnar ring buffers of (timestamp, latency, bandwidth) samples per interface
+interface_histories = {}
+
+def get_interface_history(interface_name):
+    """Get the performance history of one interface, creating it on first use"""
+    history = interface_histories.get(interface_name)
+    if history is None:
+        history = interface_histories.setdefault(interface_name, RingBuffer(HISTORY_CAPACITY))
+    return history
+
+# Persistent sample store (opened by start_monitoring)
+store = None
+
+def persist_rollup(metric, resolution, row):
+    """Write a closed rollup bucket to disk (the 1 s tier stays in memory)"""
+    if store is not None and resolution > 1:
+        store.append_rollup(metric, resolution, row)
+
+# Pre-aggregated min/max/mean/count/loss buckets
+rollups = Rollups(ROLLUP_METRICS, sink=persist_rollup, quantile_metrics=('latency', 'dns_latency'))
+
+# Streaming percentile sketches for gateway and DNS latency
+latency_sketches = {
+    'gateway': WindowedSketch(PERCENTILE_WINDOW),
+    'dns': WindowedSketch(PERCENTILE_WINDOW)
+}
+
+
+def build_interface_list(interfaces):
+    """Build the available interface list from a psutil address map"""
     interface_list = []
     
     for name, addresses in interfaces.items():
@@ -70,19 +264,52 @@ def get_all_interfaces():
     
     return interface_list
 
-def get_interface_stats(interface_name):
-    """Get statistics for a specific interface"""
+# Shared interface cache, refreshed by netlink events or polling
+interface_inventory = InterfaceInventory(build_interface_list, poll_interval=INVENTORY_POLL_INTERVAL)
+
+def get_link_speeds():
+    """Link speeds in Mbps from the inventory, so rate samples don't query the NICs"""
+    return {name: stats.speed for name, stats in interface_inventory.snapshot.stats.items()}
+
+# Per-NIC counter sampler (started by start_monitoring)
+rate_sampler = RateSampler(RATE_SAMPLE_INTERVAL, get_link_speeds)
+
+def get_all_interfaces():
+    """Get all available network interfaces"""
+    return interface_inventory.snapshot.interfaces
+
+def get_counter_snapshot():
+    """Get cumulative bytes and current rates (Mbps) for every interface at once"""
     try:
-        stats = psutil.net_io_counters(pernic=True)
-        if interface_name in stats:
+        rates = rate_sampler.rates
+        if rates:
             return {
-                'rx': stats[interface_name].bytes_recv,
-                'tx': stats[interface_name].bytes_sent
+                name: {
+                    'rx': rate['rx'],
+                    'tx': rate['tx'],
+                    'rx_mbps': round(rate['rx_bps'] * 8 / 1000000, 3),
+                    'tx_mbps': round(rate['tx_bps'] * 8 / 1000000, 3)
+                }
+                for name, rate in rates.items()
             }
-        return {'rx': 0, 'tx': 0}
+        
+        # Sampler not running yet: counters only
+        return {
+            name: {'rx': stats.bytes_recv, 'tx': stats.bytes_sent, 'rx_mbps': 0, 'tx_mbps': 0}
+            for name, stats in psutil.net_io_counters(pernic=True).items()
+        }
     except Exception as e:
         print(f"Interface stats error: {e}")
-        return {'rx': 0, 'tx': 0}
+        return {}
+
+def get_interface_stats(interface_name, snapshot=None):
+    """Get cumulative bytes and current rates (Mbps) for a specific interface"""
+    if snapshot is None:
+        snapshot = get_counter_snapshot()
+    return snapshot.get(interface_name, {'rx': 0, 'tx': 0, 'rx_mbps': 0, 'tx_mbps': 0})
+
+# Long-running ping processes used when ping3 gets no reply
+ping_workers = PingWorkerPool(interval=PING_STREAM_INTERVAL)
 
 def ping_host(host, timeout=3):
     """Ping a host and return latency in ms"""
@@ -92,6 +319,10 @@ def ping_host(host, timeout=3):
         if result is not None:
             return round(result * 1000, 2)  # Convert to milliseconds
 
+        # Fallback to the streaming ping worker for this host
+        if PING_FALLBACK == 'stream':
+            return ping_workers.latest(host)
+
         # Fallback to subprocess ping
         if os.name == 'nt':  # Windows
             cmd = f"ping -n 1 -w {timeout*1000} {host}"
@@ -112,14 +343,104 @@ def ping_host(host, timeout=3):
         print(f"Ping error for {host}: {e}")
         return None
 
-def check_interface_status(interface_name):
-    """Check if the network interface is up"""
+# Shared worker pool for latency probes
+probe_executor = ThreadPoolExecutor(max_workers=PROBE_WORKERS, thread_name_prefix='probe')
+probes_in_flight = {}
+probes_lock = threading.Lock()
+probe_rotation = 0  # Round-robin offset into the extra targets, kept between ticks
+
+# Probe target addresses, resolved when targets are set rather than while probing
+host_resolver = HostResolver()
+
+# Shared single-socket ICMP prober (opened by start_monitoring)
+icmp_prober = None
+
+# Monitor tick rate, adapted to how settled the link is
+probe_rate = ProbeRateController(MONITOR_INTERVAL, PROBE_MIN_INTERVAL, PROBE_MAX_INTERVAL, PROBE_HOLD_SECONDS,
+                                 default_pps=PROBE_TARGET_PPS, target_pps=PROBE_PPS_BUDGETS)
+
+def apply_probe_interval(interval):
+    """Move the monitor job to the controller's interval"""
+    if 'monitor' in scheduler.jobs:
+        scheduler.set_interval('monitor', interval)
+
+def get_probe_targets(state):
+    """Get the probe targets for a monitoring tick"""
+    targets = {host: host for host in state['probe_targets']}
+    targets.update({
+        'gateway': state['gateway'],
+        'dns': state['dns']
+    })
+    return targets
+
+def run_probes(targets, deadline=PROBE_DEADLINE):
+    """Ping all targets at once and return latencies within one deadline"""
+    global probe_rotation
+    if icmp_prober is not None:
+        try:
+            rtts = icmp_prober.sweep(list(set(targets.values())), timeout=deadline)
+            return {name: rtts.get(host) for name, host in targets.items()}
+        except OSError as e:
+            print(f"ICMP sweep error, falling back to per-host pings: {e}")
+    
+    futures = {}  # Host -> its probe, None when an earlier one is still running
+    
+    # Gateway and DNS first, then the extra targets starting where the last tick stopped
+    first = [targets[name] for name in ('gateway', 'dns') if name in targets]
+    rest = list(dict.fromkeys(host for host in targets.values() if host not in first))
+    
+    with probes_lock:
+        if rest:
+            offset = probe_rotation % len(rest)
+            rest = rest[offset:] + rest[:offset]
+        
+        # Only submit what idle workers can start now: a probe queued behind
+        # dead hosts would run out the deadline and be reported as lost
+        idle = PROBE_WORKERS - sum(not future.done() for future in probes_in_flight.values())
+        for host in dict.fromkeys(first + rest):
+            # A probe still running from an earlier tick counts as lost
+            pending = probes_in_flight.get(host)
+            if pending is not None and not pending.done():
+                futures[host] = None
+                continue
+            
+            # Hosts left over are not probed this tick (left out of the results)
+            if idle <= 0:
+                continue
+            idle -= 1
+            futures[host] = probes_in_flight[host] = probe_executor.submit(ping_host, host)
+        
+        # Next tick starts after the last extra target that got a probe
+        submitted = [index for index, host in enumerate(rest) if futures.get(host) is not None]
+        if submitted:
+            probe_rotation += submitted[-1] + 1
+    
+    done, _ = wait([future for future in futures.values() if future is not None], timeout=deadline)
+    
+    results = {}
+    for name, host in targets.items():
+        if host not in futures:
+            continue
+        future = futures[host]
+        if future in done and future.exception() is None:
+            results[name] = future.result()
+        else:
+            results[name] = None
+    
+    return results
+
+def check_interface_status(interface_name, snapshot=None):
+    """Check if the network interface is up (optionally from an inventory snapshot)"""
     try:
-        interfaces = psutil.net_if_addrs()
-        if interface_name not in interfaces:
+        if snapshot is None:
+            snapshot = interface_inventory.snapshot
+        if interface_name not in snapshot.addresses:
             return False, "Interface not found"
         
-        addresses = interfaces[interface_name]
+        if not snapshot.is_up(interface_name):
+            return False, f"Interface {interface_name} link is down"
+        
+        addresses = snapshot.addresses[interface_name]
         
         # Check if interface has an IP address
         for addr in addresses:
@@ -130,149 +451,270 @@ def check_interface_status(interface_name):
     except Exception as e:
         return False, f"Error checking interface: {e}"
 
-def run_speed_test():
-    """Run a speed test using iperf3 servers"""
+def no_progress(stage, message=None, **fields):
+    """Progress callback for speed tests run outside a job"""
+
+# Resolved iperf3 executable (discovered by start_monitoring)
+iperf3_binary = None
+
+def select_servers(servers, progress=no_progress):
+    """Pre-probe all candidate servers at once and return the best few"""
+    # A prober of its own: a sweep holds its prober's lock until the timeout,
+    # which on the shared one would stall monitor ticks
+    prober = open_prober(host_resolver) if icmp_prober is not None else None
+    
+    def rtt_sweep(hosts, timeout):
+        # Server names aren't probe targets, so resolve them here (alongside the TCP connects)
+        for host in hosts:
+            host_resolver.resolve(host)
+        return prober.sweep(hosts, timeout)
+    
+    try:
+        ranked = rank_servers(servers, SERVER_PROBE_TIMEOUT, rtt_sweep if prober is not None else None)
+    finally:
+        if prober is not None:
+            prober.close()
+    selected = ranked[:IPERF_BEST_SERVERS]
+    
+    summary = ', '.join(f"{server['host']} ({server['rtt_ms'] or server['connect_ms']} ms)" for server in selected)
+    print(f"Reachable servers: {len(ranked)}/{len(servers)}, testing {summary or 'none'}")
+    progress('select', f"Selected {len(selected)} of {len(servers)} servers",
+             servers=[{key: server[key] for key in ('host', 'port', 'rtt_ms', 'connect_ms')} for server in ranked])
+    return selected
+
+def select_iperf_servers(progress=no_progress):
+    """Pick the lowest-latency reachable iperf3 servers"""
+    return select_servers(IPERF_SERVERS, progress)
+
+def run_server_tests(servers, run_test, method, progress=no_progress):
+    """Measure download and upload against each server and average the results
+
+    ``run_test(host, port, direction, progress)`` returns a client result
+    (see iperf.run_client) or None. Returns None when no test succeeded.
+    """
+    download_speeds = []
+    upload_speeds = []
+    successful_tests = 0
+    total_duration = 0
+    series = []
+    
+    for server in servers:
+        try:
+            print(f"Testing with {server['host']}:{server['port']}")
+            progress(method, f"Testing with {server['host']}:{server['port']}", server=server['host'])
+            
+            # Test download speed
+            download_result = run_test(server['host'], server['port'], 'download', progress)
+            if download_result:
+                download_speeds.append(download_result['mbps'])
+                print(f"Download: {download_result['mbps']:.2f} Mbps")
+                progress(method, f"Download: {download_result['mbps']:.2f} Mbps",
+                         server=server['host'], direction='download', mbps=download_result['mbps'])
+            
+            # Test upload speed
+            upload_result = run_test(server['host'], server['port'], 'upload', progress)
+            if upload_result:
+                upload_speeds.append(upload_result['mbps'])
+                print(f"Upload: {upload_result['mbps']:.2f} Mbps")
+                progress(method, f"Upload: {upload_result['mbps']:.2f} Mbps",
+                         server=server['host'], direction='upload', mbps=upload_result['mbps'])
+            
+            for direction, result in (('download', download_result), ('upload', upload_result)):
+                if result:
+                    total_duration += result['duration']
+                    series.append({
+                        'server': server['host'],
+                        'direction': direction,
+                        'converged': result['converged'],
+                        'retransmits': result['retransmits'],
+                        'mbps': [interval['mbps'] for interval in result['intervals']]
+                    })
+            
+            if download_result or upload_result:
+                successful_tests += 1
+                
+        except Exception as e:
+            print(f"Server {server['host']} failed: {e}")
+            continue
+    
+    if successful_tests == 0:
+        return None
+    
+    # Calculate average speeds
+    avg_download = sum(download_speeds) / len(download_speeds) if download_speeds else 0
+    avg_upload = sum(upload_speeds) / len(upload_speeds) if upload_speeds else 0
+    
+    return {
+        'download_mbps': round(avg_download, 2),
+        'upload_mbps': round(avg_upload, 2),
+        'duration': round(total_duration, 2),
+        'data_size': 0,
+        'tests_run': successful_tests,
+        'servers': [server['host'] for server in servers],
+        'series': series,
+        'method': method,
+        'timestamp': datetime.now().isoformat()
+    }
+
+def run_speed_test(progress=no_progress):
+    """Run a speed test against our own throughput servers, then iperf3 servers"""
     try:
+        if THROUGHPUT_SERVERS:
+            print("Running built-in throughput test...")
+            result = run_server_tests(select_servers(THROUGHPUT_SERVERS, progress), run_builtin_test, 'builtin', progress)
+            if result:
+                return result
+        
+        if iperf3_binary is None:
+            print("iperf3 not found, falling back to HTTP download test...")
+            return run_http_speed_test(progress)
+        
         print("Running iperf3 speed test...")
+        result = run_server_tests(select_iperf_servers(progress), run_iperf3_test, 'iperf3', progress)
+        if result:
+            return result
         
-        # List of public iperf3 servers (add your AWS server IP here)
-        iperf_servers = [
-            # Add your AWS EC2 iperf3 server here for best results
-            # {'host': 'YOUR_AWS_EC2_IP', 'port': 5201},
-            
-            # Public iperf3 servers (fallback)
-            {'host': 'iperf.par2.as49434.net', 'port': 5201},
-            {'host': 'iperf.biznetnetworks.com', 'port': 5201},
-            {'host': 'iperf.he.net', 'port': 5201},
-            {'host': 'speedtest.serverius.net', 'port': 5002},
-        ]
-        
-        download_speeds = []
-        upload_speeds = []
-        successful_tests = 0
+        # Fallback to HTTP download test
+        print("Falling back to HTTP download test...")
+        return run_http_speed_test(progress)
         
-        for server in iperf_servers:
-            try:
-                print(f"Testing with {server['host']}:{server['port']}")
-                
-                # Test download speed
-                download_result = run_iperf3_test(server['host'], server['port'], 'download')
-                if download_result:
-                    download_speeds.append(download_result['mbps'])
-                    print(f"Download: {download_result['mbps']:.2f} Mbps")
-                
-                # Test upload speed
-                upload_result = run_iperf3_test(server['host'], server['port'], 'upload')
-                if upload_result:
-                    upload_speeds.append(upload_result['mbps'])
-                    print(f"Upload: {upload_result['mbps']:.2f} Mbps")
-                
-                if download_result or upload_result:
-                    successful_tests += 1
-                    
-            except Exception as e:
-                print(f"Server {server['host']} failed: {e}")
-                continue
+    except Exception as e:
+        print(f"Speed test error: {e}")
+        return run_http_speed_test(progress)
+
+def run_builtin_test(host, port, direction, progress=no_progress):
+    """Measure download or upload against one of our throughput servers"""
+    def on_interval(interval):
+        progress('builtin', f"{direction.capitalize()} {interval['end']:.0f}s: {interval['mbps']:.2f} Mbps",
+                 server=host, direction=direction, interval=interval)
+    
+    return throughput.run_client(host, port, reverse=direction == 'download',
+                                 duration=IPERF_MAX_SECONDS, on_interval=on_interval,
+                                 tolerance=IPERF_CONVERGENCE_TOLERANCE)
+
+def run_saturation_test(progress=no_progress):
+    """Fill the link with parallel streams to several servers at once"""
+    try:
+        if iperf3_binary is None:
+            print("iperf3 not found, falling back to HTTP download test...")
+            return run_http_speed_test(progress)
         
-        if successful_tests > 0:
-            # Calculate average speeds
-            avg_download = sum(download_speeds) / len(download_speeds) if download_speeds else 0
-            avg_upload = sum(upload_speeds) / len(upload_speeds) if upload_speeds else 0
+        servers = select_iperf_servers(progress)[:IPERF_SATURATION_SERVERS]
+        saturation = {}
+        total_duration = 0
+        tests_run = 0
+        
+        for direction in ('download', 'upload'):
+            def on_interval(host, interval):
+                progress('iperf3', f"{direction.capitalize()} {host} {interval['end']:.0f}s: {interval['mbps']:.2f} Mbps",
+                         server=host, direction=direction, interval=interval)
+            
+            best, steps = find_saturation(
+                iperf3_binary, servers, reverse=direction == 'download',
+                ladder=IPERF_STREAM_LADDER, min_gain=IPERF_MIN_STREAM_GAIN,
+                duration=IPERF_MAX_SECONDS, tolerance=IPERF_CONVERGENCE_TOLERANCE,
+                on_interval=on_interval
+            )
+            total_duration += sum(step['duration'] for step in steps)
+            tests_run += len(steps)
+            if best is None:
+                continue
             
+            print(f"{direction.capitalize()}: {best['mbps']:.2f} Mbps with {best['streams']} streams per server")
+            progress('iperf3', f"{direction.capitalize()}: {best['mbps']:.2f} Mbps with {best['streams']} streams per server",
+                     direction=direction, mbps=best['mbps'], streams=best['streams'])
+            saturation[direction] = {
+                'mbps': best['mbps'],
+                'streams': best['streams'],
+                'per_stream_mbps': best['per_stream_mbps'],
+                'retransmits': best['retransmits'],
+                'per_server': best['servers'],
+                'steps': [
+                    {'streams': step['streams'], 'mbps': step['mbps'], 'retransmits': step['retransmits']}
+                    for step in steps
+                ]
+            }
+        
+        if saturation:
             return {
-                'download_mbps': round(avg_download, 2),
-                'upload_mbps': round(avg_upload, 2),
-                'duration': 30,  # iperf3 test duration
+                'download_mbps': saturation.get('download', {}).get('mbps', 0),
+                'upload_mbps': saturation.get('upload', {}).get('mbps', 0),
+                'duration': round(total_duration, 2),
                 'data_size': 0,
-                'tests_run': successful_tests,
-                'method': 'iperf3',
+                'tests_run': tests_run,
+                'servers': [server['host'] for server in servers],
+                'saturation': saturation,
+                'method': 'iperf3_parallel',
                 'timestamp': datetime.now().isoformat()
             }
         
         # Fallback to HTTP download test
         print("Falling back to HTTP download test...")
-        return run_http_speed_test()
+        return run_http_speed_test(progress)
         
     except Exception as e:
-        print(f"iperf3 test error: {e}")
-        return run_http_speed_test()
+        print(f"iperf3 saturation test error: {e}")
+        return run_http_speed_test(progress)
 
-def run_iperf3_test(host, port, direction):
-    """Run iperf3 test for download or upload"""
+def run_iperf3_test(host, port, direction, progress=no_progress):
+    """Run iperf3 test for download or upload, stopping early once throughput settles"""
     try:
-        # Full path to iperf3 executable
-        iperf3_path = r"C:\Users\ogcur\AppData\Local\Microsoft\WinGet\Packages\ar51an.iPerf3_Microsoft.Winget.Source_8wekyb3d8bbwe\iperf3.exe"
-        
-        # Check if iperf3 is available
-        result = subprocess.run([iperf3_path, '--version'], capture_output=True, text=True, timeout=5)
-        if result.returncode != 0:
+        # Resolved once at startup
+        if iperf3_binary is None:
             print("iperf3 not found, skipping iperf3 test")
             return None
         
-        # Run iperf3 test
-        if direction == 'download':
-            cmd = [iperf3_path, '-c', host, '-p', str(port), '-t', '10', '-f', 'm', '--json']
-        else:  # upload
-            cmd = [iperf3_path, '-c', host, '-p', str(port), '-t', '10', '-f', 'm', '--json', '-R']
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        def on_interval(interval):
+            progress('iperf3', f"{direction.capitalize()} {interval['end']:.0f}s: {interval['mbps']:.2f} Mbps",
+                     server=host, direction=direction, interval=interval)
         
-        if result.returncode == 0:
-            data = json.loads(result.stdout)
-            if 'end' in data and 'sum_received' in data['end']:
-                # Download test
-                mbps = data['end']['sum_received']['bits_per_second'] / 1000000
-            elif 'end' in data and 'sum_sent' in data['end']:
-                # Upload test
-                mbps = data['end']['sum_sent']['bits_per_second'] / 1000000
-            else:
-                return None
-            
-            return {'mbps': mbps}
-        
-        return None
+        # Download means the server sends (-R)
+        return run_client(iperf3_binary, host, port, reverse=direction == 'download',
+                          duration=IPERF_MAX_SECONDS, on_interval=on_interval,
+                          tolerance=IPERF_CONVERGENCE_TOLERANCE)
         
     except Exception as e:
         print(f"iperf3 test failed: {e}")
         return None
 
-def run_http_speed_test():
+def run_http_speed_test(progress=no_progress):
     """Fallback HTTP speed test"""
     try:
         print("Running HTTP download speed test...")
         
-        # Test URLs with known large files
-        test_urls = [
-            'https://httpbin.org/bytes/1048576',  # 1MB file
-            'https://httpbin.org/bytes/2097152',  # 2MB file
-            'https://httpbin.org/bytes/5242880',  # 5MB file
-        ]
-        
         total_data = 0
         total_duration = 0
         successful_tests = 0
+        series = []
         
-        for url in test_urls:
+        for url in HTTP_TEST_URLS:
             try:
                 print(f"Testing: {url}")
-                start_time = time.time()
-                response = requests.get(url, timeout=30, stream=True)
-                end_time = time.time()
+                progress('http', f"Testing: {url}", url=url)
+                
+                def on_interval(interval):
+                    progress('http', f"Download {interval['end']:.0f}s: {interval['mbps']:.2f} Mbps",
+                             server=url, direction='download', interval=interval)
+                
+                result = http_speed.run_download(url, HTTP_TEST_CONNECTIONS, timeout=30,
+                                                 max_seconds=HTTP_TEST_MAX_SECONDS, on_interval=on_interval)
                 
-                if response.status_code == 200:
-                    # Read the content to get actual data size
-                    content = response.content
-                    data_size = len(content)
-                    duration = end_time - start_time
+                if result['duration'] > 0:
+                    total_data += result['bytes']
+                    total_duration += result['duration']
+                    successful_tests += 1
+                    series.append({
+                        'server': url,
+                        'direction': 'download',
+                        'connections': result['connections'],
+                        'ttfb': result['ttfb'],
+                        'mbps': [interval['mbps'] for interval in result['intervals']]
+                    })
                     
-                    if duration > 0:
-                        total_data += data_size
-                        total_duration += duration
-                        successful_tests += 1
-                        
-                        # Calculate speed for this test
-                        speed_mbps = (data_size * 8) / (duration * 1024 * 1024)
-                        print(f"Download test: {data_size/1024/1024:.2f} MB in {duration:.2f}s = {speed_mbps:.2f} Mbps")
+                    print(f"Download test: {result['bytes']/1024/1024:.2f} MB in {result['duration']:.2f}s "
+                          f"over {result['connections']} connections = {result['mbps']:.2f} Mbps")
+                    progress('http', f"{result['bytes']/1024/1024:.2f} MB in {result['duration']:.2f}s",
+                             url=url, direction='download', mbps=result['mbps'])
                         
             except Exception as e:
                 print(f"Test failed for {url}: {e}")
@@ -280,28 +722,56 @@ def run_http_speed_test():
         
         if successful_tests > 0 and total_duration > 0:
             # Calculate average speed
-            avg_speed_mbps = (total_data * 8) / (total_duration * 1024 * 1024)
+            avg_speed_mbps = (total_data * 8) / (total_duration * 1e6)
             
-            # Estimate upload speed (typically 10-20% of download)
-            estimated_upload = avg_speed_mbps * 0.15
+            upload_result = run_http_upload(HTTP_UPLOAD_URL, progress)
+            if upload_result:
+                total_duration += upload_result['duration']
+                series.append({
+                    'server': HTTP_UPLOAD_URL,
+                    'direction': 'upload',
+                    'connections': upload_result['connections'],
+                    'mbps': [interval['mbps'] for interval in upload_result['intervals']]
+                })
             
             return {
                 'download_mbps': round(avg_speed_mbps, 2),
-                'upload_mbps': round(estimated_upload, 2),
+                'upload_mbps': upload_result['mbps'] if upload_result else 0,
                 'duration': round(total_duration, 2),
                 'data_size': total_data,
                 'tests_run': successful_tests,
+                'series': series,
                 'method': 'http_download',
                 'timestamp': datetime.now().isoformat()
             }
         
         # Final fallback to ping test
         print("Falling back to ping test...")
-        return run_ping_speed_test()
+        return run_ping_speed_test(progress)
         
     except Exception as e:
         print(f"HTTP speed test error: {e}")
-        return run_ping_speed_test()
+        return run_ping_speed_test(progress)
+
+def run_http_upload(url, progress=no_progress):
+    """Stream HTTP_UPLOAD_BYTES to an upload endpoint; return the result or None"""
+    try:
+        print(f"Testing upload: {url}")
+        progress('http', f"Testing upload: {url}", url=url)
+        
+        def on_interval(interval):
+            progress('http', f"Upload {interval['end']:.0f}s: {interval['mbps']:.2f} Mbps",
+                     server=url, direction='upload', interval=interval)
+        
+        result = http_speed.run_upload(url, HTTP_UPLOAD_BYTES, HTTP_TEST_CONNECTIONS, timeout=30,
+                                       max_seconds=HTTP_TEST_MAX_SECONDS, on_interval=on_interval)
+        print(f"Upload test: {result['bytes']/1024/1024:.2f} MB in {result['duration']:.2f}s "
+              f"over {result['connections']} connections = {result['mbps']:.2f} Mbps")
+        progress('http', f"Upload: {result['mbps']:.2f} Mbps", url=url, direction='upload', mbps=result['mbps'])
+        return result
+    except Exception as e:
+        print(f"Upload test failed for {url}: {e}")
+        return None
 
 def run_speedtest_net():
     """Run speed test using speedtest.net API"""
@@ -319,29 +789,18 @@ def run_speedtest_net():
                 download_url = f"https://{server['host']}/speedtest/random{random.randint(1000, 9999)}x{random.randint(1000, 9999)}.jpg"
                 
                 # Download test
-                start_time = time.time()
-                download_response = requests.get(download_url, timeout=30)
-                download_end = time.time()
+                download_result = http_speed.run_download(download_url, HTTP_TEST_CONNECTIONS, timeout=30,
+                                                          max_seconds=HTTP_TEST_MAX_SECONDS)
                 
-                if download_response.status_code == 200:
-                    download_size = len(download_response.content)
-                    download_duration = download_end - start_time
-                    download_mbps = (download_size * 8) / (download_duration * 1024 * 1024)
-                    
-                    # Upload test (simplified)
-                    upload_data = b'0' * 1024 * 1024  # 1MB test data
-                    upload_start = time.time()
-                    upload_response = requests.post(server_url, data=upload_data, timeout=30)
-                    upload_end = time.time()
-                    
-                    upload_duration = upload_end - upload_start
-                    upload_mbps = (len(upload_data) * 8) / (upload_duration * 1024 * 1024) if upload_duration > 0 else 0
+                if download_result['bytes'] > 0:
+                    upload_result = run_http_upload(server_url)
+                    upload_duration = upload_result['duration'] if upload_result else 0
                     
                     return {
-                        'download_mbps': round(download_mbps, 2),
-                        'upload_mbps': round(upload_mbps, 2),
-                        'duration': round(download_duration + upload_duration, 2),
-                        'data_size': download_size,
+                        'download_mbps': download_result['mbps'],
+                        'upload_mbps': upload_result['mbps'] if upload_result else 0,
+                        'duration': round(download_result['duration'] + upload_duration, 2),
+                        'data_size': download_result['bytes'],
                         'tests_run': 1,
                         'method': 'speedtest.net',
                         'timestamp': datetime.now().isoformat()
@@ -354,33 +813,41 @@ def run_speedtest_net():
         print(f"Speedtest.net error: {e}")
         return run_ping_speed_test()
 
-def run_ping_speed_test():
-    """Fallback ping-based speed test"""
+def run_ping_speed_test(progress=no_progress):
+    """Fallback ping-based speed test: fit RTT against ICMP payload size"""
     try:
-        results = []
-        for size in [32, 64, 128, 512, 1024]:
-            if os.name == 'nt':  # Windows
-                cmd = f"ping -n 4 -l {size} {monitoring_data['gateway']}"
-            else:
-                cmd = f"ping -c 4 -s {size} {monitoring_data['gateway']}"
-            
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if 'Average' in line or 'avg' in line.lower():
-                        avg_time = line.split('=')[-1].strip().replace('ms', '')
-                        try:
-                            results.append(float(avg_time))
-                        except:
-                            pass
-                        break
+        gateway = monitoring_state.current['gateway']
+        progress('ping', f"Pinging {gateway} with {len(PING_SWEEP_SIZES)} payload sizes",
+                 sizes=list(PING_SWEEP_SIZES))
+        started = time.perf_counter()
+        if icmp_prober is not None:
+            host_resolver.resolve(gateway)
+            samples = icmp_prober.size_sweep(gateway, PING_SWEEP_SIZES, PING_SWEEP_TIMEOUT, PING_SWEEP_COUNT)
+        else:
+            samples = {
+                size: [ping(gateway, timeout=PING_SWEEP_TIMEOUT, unit='ms', size=size) or None
+                       for _ in range(PING_SWEEP_COUNT)]
+                for size in PING_SWEEP_SIZES
+            }
+        duration = time.perf_counter() - started
         
+        fit = fit_serialization_delay(samples)
+        results = [min(rtt for rtt in rtts if rtt is not None) for rtts in samples.values()
+                   if any(rtt is not None for rtt in rtts)]
         if results:
+            sent = len(PING_SWEEP_SIZES) * PING_SWEEP_COUNT
+            lost = sum(rtt is None for rtts in samples.values() for rtt in rtts)
             avg_ping = sum(results) / len(results)
+            if fit and fit['bottleneck_mbps']:
+                print(f"Ping sweep: {fit['per_byte_us']} us/byte, ~{fit['bottleneck_mbps']} Mbps bottleneck")
+                progress('ping', f"~{fit['bottleneck_mbps']} Mbps bottleneck", fit=fit)
             return {
                 'ping_results': results,
                 'average_ping': round(avg_ping, 2),
+                'loss_percent': round(lost / sent * 100, 1),
+                'size_fit': fit,
+                'duration': round(duration, 3),
+                'method': 'icmp_size_sweep',
                 'timestamp': datetime.now().isoformat()
             }
         else:
@@ -389,130 +856,380 @@ def run_ping_speed_test():
     except Exception as e:
         return {'error': str(e)}
 
-def update_performance_metrics(latency, bandwidth):
-    """Update performance tracking metrics"""
-    global monitoring_data
+def update_performance_metrics(state, latency, bandwidth, dns_latency=None, probed=('latency', 'dns_latency')):
+    """Update performance tracking metrics and return the changed fields
+
+    Latency metrics missing from ``probed`` were skipped by their packet
+    budget this tick: they are left out of the sketches and rollups rather
+    than counted as loss, and stored as NaN in the raw probe series.
+    """
+    changes = {}
     
     # Update worst latency
-    if latency and latency > monitoring_data['worst_latency']:
-        monitoring_data['worst_latency'] = latency
+    if latency and latency > state['worst_latency']:
+        changes['worst_latency'] = latency
     
-    # Calculate current bandwidth in Mbps
-    current_bandwidth = (bandwidth['rx'] + bandwidth['tx']) / (1024 * 1024)
+    # Current bandwidth in Mbps (summed over all monitored interfaces)
+    current_bandwidth = bandwidth.get('rx_mbps', 0) + bandwidth.get('tx_mbps', 0)
     
     # Update best/worst bandwidth
-    if current_bandwidth > monitoring_data['best_bandwidth']:
-        monitoring_data['best_bandwidth'] = current_bandwidth
+    if current_bandwidth > state['best_bandwidth']:
+        changes['best_bandwidth'] = current_bandwidth
+    
+    if current_bandwidth < state['worst_bandwidth'] and current_bandwidth > 0:
+        changes['worst_bandwidth'] = current_bandwidth
+    
+    now = time.time()
+    
+    # Track latency percentiles per window and over the process lifetime
+    latency_sketches['gateway'].add(now, latency if 'latency' in probed else None)
+    latency_sketches['dns'].add(now, dns_latency if 'dns_latency' in probed else None)
+    changes['latency_percentiles'] = {
+        name: sketch.summary() for name, sketch in latency_sketches.items()
+    }
+    
+    # Fold the sample into the rollup tiers
+    samples = {'latency': latency, 'dns_latency': dns_latency, 'bandwidth': current_bandwidth}
+    rollups.add(now, {metric: value for metric, value in samples.items()
+                      if metric == 'bandwidth' or metric in probed})
+    
+    # Persist the sample so history survives restarts
+    if store is not None:
+        store.append_probe(now, latency if 'latency' in probed else None,
+                           dns_latency if 'dns_latency' in probed else None, current_bandwidth)
     
-    if current_bandwidth < monitoring_data['worst_bandwidth'] and current_bandwidth > 0:
-        monitoring_data['worst_bandwidth'] = current_bandwidth
+    return changes
+
+def get_monitored_interfaces(state, available_interfaces):
+    """Get the interfaces to collect: every available one plus the selected one"""
+    names = [iface['name'] for iface in available_interfaces]
+    selected_interface = state.get('selected_interface')
+    if selected_interface and selected_interface not in names:
+        names.append(selected_interface)
+    return names
+
+def track_interface_status(state, name, interface_up, status_msg, interface_found):
+    """Return a copy of one interface's state with its status and downtime tracking updated"""
+    if state is None:
+        state = {
+            'name': name,
+            'status': 'unknown',
+            'last_down_time': None,
+            'downtime_count': 0,
+            'uptime': 0
+        }
+    state = dict(state)
     
-    # Add to performance history (keep last 100 entries)
-    monitoring_data['performance_history'].append({
-        'timestamp': datetime.now().isoformat(),
-        'latency': latency,
-        'bandwidth': current_bandwidth
+    # Track downtime
+    if not interface_up and state['status'] == 'online':
+        state['last_down_time'] = datetime.now().isoformat()
+        state['downtime_count'] += 1
+    
+    state.update({
+        'status': 'online' if interface_up else 'offline',
+        'status_message': status_msg,
+        'interface_found': interface_found
     })
+    return state
+
+def get_route_interface(host, snapshot):
+    """Name of the interface the kernel routes ``host`` through, or None"""
+    address = host_resolver.lookup(host)
+    if address is None:
+        return None
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect((address, 9))  # Only picks a route; nothing is sent
+            source = sock.getsockname()[0]
+    except OSError as e:
+        print(f"Route lookup error for {host}: {e}")
+        return None
+    for name, addresses in snapshot.addresses.items():
+        if any(addr.family == socket.AF_INET and addr.address == source for addr in addresses):
+            return name
+    return None
+
+def update_interface_state(state, name, interface_up, status_msg, interface_found, bandwidth, latency, now):
+    """Return one interface's new state: status, downtime tracking, counters and history cursor"""
+    state = track_interface_status(state, name, interface_up, status_msg, interface_found)
+    
+    # The sample is in the buffer before any published state points past it
+    history = get_interface_history(name)
+    history.append(now, latency, bandwidth['rx_mbps'] + bandwidth['tx_mbps'])
+    
+    state.update({
+        'bandwidth': bandwidth,
+        'uptime': state['uptime'] + (1 if interface_up else 0),
+        'last_check': datetime.now().isoformat(),
+        'history_cursor': history.total
+    })
+    return state
+
+def on_interfaces_changed(snapshot):
+    """Apply link and address changes as soon as the inventory sees them"""
+    changed = []
+    
+    def apply_inventory(state):
+        interfaces = {}
+        for name, interface_state in state['interfaces'].items():
+            interface_up, status_msg = check_interface_status(name, snapshot)
+            interfaces[name] = track_interface_status(interface_state, name, interface_up, status_msg,
+                                                      name in snapshot.addresses)
+        # Listeners also run on periodic refreshes: note whether anything actually changed
+        changed.append(interfaces != state['interfaces'] or snapshot.interfaces != state['available_interfaces'])
+        changes = selected_view(interfaces, state['selected_interface'])
+        changes.update(available_interfaces=snapshot.interfaces, interfaces=interfaces)
+        return changes
     
-    if len(monitoring_data['performance_history']) > 100:
-        monitoring_data['performance_history'].pop(0)
+    update_state(apply_inventory)
+    
+    # Watch the link closely while it settles
+    if any(changed):
+        apply_probe_interval(probe_rate.event('interface change'))
+
+interface_inventory.add_listener(on_interfaces_changed)
+
+def selected_view(interfaces, selected_interface):
+    """Top-level status fields showing the selected interface's state"""
+    state = interfaces.get(selected_interface)
+    if state is None:
+        return {}
+    return {
+        'status': state['status'],
+        'interface_found': state['interface_found'],
+        'last_down_time': state['last_down_time'],
+        'downtime_count': state['downtime_count'],
+        'bandwidth': state.get('bandwidth', initial_state['bandwidth'])
+    }
 
 def monitor_network():
     """Main monitoring function"""
-    global monitoring_data
-    
     try:
-        # Update available interfaces
-        monitoring_data['available_interfaces'] = get_all_interfaces()
+        # One address snapshot and one counter snapshot shared by all interfaces
+        inventory = interface_inventory.snapshot
+        counters = get_counter_snapshot()
+        current = monitoring_state.current
+        monitored_interfaces = get_monitored_interfaces(current, inventory.interfaces)
         
-        # Use selected interface
-        selected_interface = monitoring_data.get('selected_interface')
+        # Measure latency (all targets within their packet budget probed concurrently)
+        targets = get_probe_targets(current)
+        probed_at = time.time()
+        due = probe_rate.due_targets(targets, probed_at)
+        measured = run_probes(due, min(PROBE_DEADLINE, probe_rate.interval * 0.8))
+        now = time.time()
+        # Only targets with a result had a probe out; the rest stay due for the next tick
+        apply_probe_interval(probe_rate.observe({due[name]: rtt for name, rtt in measured.items()}, now, probed_at))
         
-        # Check interface status
-        interface_up, status_msg = check_interface_status(selected_interface)
+        # Targets skipped by their budget record no sample this tick; the status
+        # keeps showing their last measurement until they are lost
+        latencies = {name: measured[name] if name in measured else probe_rate.latest(host)
+                     for name, host in targets.items()}
+        gateway_latency = measured.get('gateway')
+        dns_latency = measured.get('dns')
+        probed = [metric for name, metric in (('gateway', 'latency'), ('dns', 'dns_latency')) if name in measured]
         
-        # Track downtime
-        if not interface_up and monitoring_data['status'] == 'online':
-            monitoring_data['last_down_time'] = datetime.now().isoformat()
-            monitoring_data['downtime_count'] += 1
+        # The gateway probe follows the default route, so only that interface's
+        # history gets its latency; the others record None (bandwidth only)
+        probe_interface = get_route_interface(targets['gateway'], inventory)
         
-        # Get interface info
-        monitoring_data['interface_found'] = selected_interface in [iface['name'] for iface in monitoring_data['available_interfaces']]
+        # Drop streaming ping workers and rate trackers for targets that were removed
+        ping_workers.retain(set(targets.values()))
+        probe_rate.retain(set(targets.values()))
         
-        # Measure latency
-        gateway_latency = ping_host(monitoring_data['gateway'])
-        dns_latency = ping_host(monitoring_data['dns'])
-        
-        # Get bandwidth usage
-        bandwidth = get_interface_stats(selected_interface)
+        def apply_tick(state):
+            # Check every monitored interface in the same pass
+            interfaces = dict(state['interfaces'])
+            total_bandwidth = {'rx_mbps': 0, 'tx_mbps': 0}
+            for name in monitored_interfaces:
+                interface_up, status_msg = check_interface_status(name, inventory)
+                bandwidth = get_interface_stats(name, counters)
+                interfaces[name] = update_interface_state(
+                    interfaces.get(name), name, interface_up, status_msg, name in inventory.addresses,
+                    bandwidth, gateway_latency if name == probe_interface else None, now
+                )
+                total_bandwidth['rx_mbps'] += bandwidth['rx_mbps']
+                total_bandwidth['tx_mbps'] += bandwidth['tx_mbps']
+            
+            # Update performance metrics
+            changes = update_performance_metrics(state, gateway_latency, total_bandwidth, dns_latency, probed)
+            
+            # Update monitoring data
+            changes.update({
+                'available_interfaces': inventory.interfaces,
+                'interfaces': interfaces,
+                'target_latency': {host: latencies.get(host) for host in state['probe_targets']},
+                'ping_workers': ping_workers.status(),
+                'probe_rate': probe_rate.status(),
+                'latency': latencies.get('gateway') or 0,
+                'dns_latency': latencies.get('dns') or 0,
+                'uptime': state['uptime'] + 1,
+                'last_check': datetime.now().isoformat()
+            })
+            changes.update(selected_view(interfaces, state['selected_interface']))
+            return changes
         
-        # Update performance metrics
-        update_performance_metrics(gateway_latency, bandwidth)
+        state = update_state(apply_tick)
         
-        # Update monitoring data
-        monitoring_data.update({
-            'status': 'online' if interface_up else 'offline',
-            'latency': gateway_latency or 0,
-            'dns_latency': dns_latency or 0,
-            'bandwidth': bandwidth,
-            'uptime': monitoring_data['uptime'] + 1,
-            'last_check': datetime.now().isoformat()
-        })
-        
-        print(f"Monitor check: Status={monitoring_data['status']}, "
-              f"Latency={monitoring_data['latency']}ms, "
-              f"Interface={selected_interface}, "
-              f"Worst Latency={monitoring_data['worst_latency']}ms")
+        print(f"Monitor check: Status={state['status']}, "
+              f"Latency={state['latency']}ms, "
+              f"Interface={state['selected_interface']}, "
+              f"Monitored={len(monitored_interfaces)}, "
+              f"Worst Latency={state['worst_latency']}ms")
               
     except Exception as e:
         print(f"Monitoring error: {e}")
-        monitoring_data['status'] = 'error'
+        update_state({'status': 'error'})
+
+def record_speed_test_result(speed_result):
+    """Publish a speed test result and persist it"""
+    changes = {
+        'fast_com_speed': speed_result,
+        'last_fast_com_test': datetime.now().isoformat()
+    }
+    
+    # A full test recalibrates the packet-train estimate
+    if speed_result and 'download_mbps' in speed_result:
+        calibrated = [bandwidth_tracker.calibrate(direction, speed_result[f'{direction}_mbps'])
+                      for direction in ('download', 'upload')]
+        if any(calibrated):
+            changes['link_estimate'] = bandwidth_tracker.estimate()
+    update_state(changes)
+    
+    if store is not None and speed_result and 'download_mbps' in speed_result:
+        store.append_speed_test(time.time(), speed_result)
+    broadcaster.publish('speed_test', json_safe_fields(speed_result or {}))
+
+def restore_last_speed_test():
+    """Reload the newest stored speed test result after a restart"""
+    last = store.speed_tests.last()
+    if last is None:
+        return
+    
+    timestamp = datetime.fromtimestamp(last['timestamp']).isoformat()
+    update_state({
+        'fast_com_speed': {
+            'download_mbps': last['download_mbps'],
+            'upload_mbps': last['upload_mbps'],
+            'duration': last['duration'],
+            'method': last['method'],
+            'timestamp': timestamp
+        },
+        'last_fast_com_test': timestamp
+    })
+
+def load_rollups():
+    """Reload closed rollup buckets from disk after a restart"""
+    now = time.time()
+    for metric in ROLLUP_METRICS:
+        for resolution, tier in rollups.tiers[metric].items():
+            if resolution > 1:
+                rollups.load(metric, resolution, store.load_rollups(metric, resolution, now - tier.retention))
+
+def expire_stored_history():
+    """Delete on-disk samples and rollup buckets past their retention"""
+    now = time.time()
+    store.probes.expire(now - RAW_RETENTION)
+    for metric in ROLLUP_METRICS:
+        for resolution, tier in rollups.tiers[metric].items():
+            if resolution > 1:
+                store.rollup_series(metric, resolution).expire(now - tier.retention)
+
+# One speed test at a time; manual and scheduled requests share the running one
+speed_tests = SpeedTestRunner(
+    {'standard': run_speed_test, 'saturation': run_saturation_test},
+    on_result=record_speed_test_result
+)
+
+# Recent packet-train estimates, calibrated by full speed tests
+bandwidth_tracker = BandwidthTracker()
+
+def run_packet_trains():
+    """Estimate download and upload bandwidth from one packet train each"""
+    # A full speed test in progress would swamp the trains
+    if speed_tests.current is not None and not speed_tests.current.done:
+        return
+    
+    for direction in ('download', 'upload'):
+        result = run_train(PACKET_TRAIN_SERVER['host'], PACKET_TRAIN_SERVER['port'], direction,
+                           PACKET_TRAIN_COUNT, PACKET_TRAIN_SIZE)
+        if result:
+            bandwidth_tracker.add(result)
+    update_state({'link_estimate': bandwidth_tracker.estimate()})
 
 def run_scheduled_speed_test():
     """Run speed test every 3 minutes"""
     try:
         print("Running speed test...")
-        speed_result = run_speed_test()
-        monitoring_data['fast_com_speed'] = speed_result
-        monitoring_data['last_fast_com_test'] = datetime.now().isoformat()
+        job, started = speed_tests.start('scheduled')
+        if not started:
+            print(f"Speed test {job.id} already running, sharing its result")
+        job.wait()
+        if job.error is not None:
+            print(f"Speed test error: {job.error}")
+            return
+        speed_result = job.result
         
         # Update bandwidth tracking from speed test results
         if speed_result and 'download_mbps' in speed_result:
             download_speed = speed_result['download_mbps']
             
-            # Update best bandwidth (highest speed)
-            if download_speed > monitoring_data['best_bandwidth']:
-                monitoring_data['best_bandwidth'] = download_speed
-                print(f"New best bandwidth: {download_speed} Mbps")
+            def apply_speed(state):
+                changes = {}
+                
+                # Update best bandwidth (highest speed)
+                if download_speed > state['best_bandwidth']:
+                    changes['best_bandwidth'] = download_speed
+                    print(f"New best bandwidth: {download_speed} Mbps")
+                
+                # Update worst bandwidth (lowest speed)
+                if download_speed < state['worst_bandwidth']:
+                    changes['worst_bandwidth'] = download_speed
+                    print(f"New worst bandwidth: {download_speed} Mbps")
+                return changes
             
-            # Update worst bandwidth (lowest speed)
-            if download_speed < monitoring_data['worst_bandwidth']:
-                monitoring_data['worst_bandwidth'] = download_speed
-                print(f"New worst bandwidth: {download_speed} Mbps")
+            update_state(apply_speed)
         
         print(f"Speed test completed: {speed_result}")
     except Exception as e:
         print(f"Speed test error: {e}")
 
+# Recurring jobs (started by start_monitoring)
+scheduler = Scheduler()
+
 def start_monitoring():
     """Start the monitoring thread"""
-    def run_monitor():
-        while True:
-            monitor_network()
-            time.sleep(5)  # Check every 5 seconds
-    
-    def run_scheduler():
-        while True:
-            # Run speed test every 3 minutes
-            if datetime.now().minute % 3 == 0 and datetime.now().second < 5:
-                run_scheduled_speed_test()
-            time.sleep(1)
+    global icmp_prober, store, iperf3_binary
+    icmp_prober = open_prober(host_resolver)
+    host_resolver.refresh(set(get_probe_targets(monitoring_state.current).values()))
+    iperf3_binary = discover_iperf3()
+    if iperf3_binary is not None:
+        print(f"Using iperf3 {iperf3_binary.version} at {iperf3_binary.path}")
+    if THROUGHPUT_SERVER_PORT:
+        throughput.ThroughputServer(port=THROUGHPUT_SERVER_PORT).start()
+    if HTTP_UPLOAD_SINK_PORT:
+        http_speed.SinkServer(port=HTTP_UPLOAD_SINK_PORT).start()
+    if PACKET_TRAIN_SERVER_PORT:
+        TrainServer(port=PACKET_TRAIN_SERVER_PORT).start()
+    rate_sampler.start()
+    interface_inventory.start()
     
-    monitor_thread = threading.Thread(target=run_monitor, daemon=True)
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+    # Map the on-disk history (segments are mapped, not parsed)
+    store = TimeSeriesStore(DATA_DIR)
+    atexit.register(store.flush)
+    restore_last_speed_test()
+    load_rollups()
     
-    monitor_thread.start()
-    scheduler_thread.start()
+    # Fixed-rate jobs; a run that overlaps its own previous run is skipped
+    scheduler.add_job('monitor', monitor_network, MONITOR_INTERVAL, run_now=True)
+    # With packet trains tracking the link, full tests are only needed to calibrate them
+    speed_test_interval = SPEED_TEST_CALIBRATION_INTERVAL if PACKET_TRAIN_SERVER else SPEED_TEST_INTERVAL
+    scheduler.add_job('speed_test', run_scheduled_speed_test, speed_test_interval,
+                      jitter=SPEED_TEST_JITTER, align=True)
+    if PACKET_TRAIN_SERVER:
+        scheduler.add_job('packet_train', run_packet_trains, PACKET_TRAIN_INTERVAL)
+    scheduler.add_job('retention', expire_stored_history, RETENTION_INTERVAL)
+    scheduler.add_job('flush', store.flush, FLUSH_INTERVAL)
+    scheduler.start()
 
 # Flask Routes
 @app.route('/')
@@ -520,10 +1237,116 @@ def dashboard():
     """Main dashboard"""
     return render_template('dashboard.html')
 
+def json_safe_fields(fields):
+    """Replace non-finite top-level floats (e.g. worst_bandwidth = inf) with None"""
+    return {
+        key: None if isinstance(value, float) and not math.isfinite(value) else value
+        for key, value in fields.items()
+    }
+
+def get_history_memory():
+    """Summarize the memory held by the per-interface histories"""
+    histories = list(interface_histories.values())
+    return {
+        'interfaces': len(histories),
+        'capacity': HISTORY_CAPACITY,
+        'samples': sum(len(history) for history in histories),
+        'bytes_per_sample': histories[0].bytes_per_sample() if histories else 0,
+        'memory_bytes': sum(history.memory_usage()['memory_bytes'] for history in histories)
+    }
+
+def build_status_payload(state, since=None, cursor=0, epoch=STATE_EPOCH):
+    """Build a full status payload from a state version, or a delta since an
+    earlier version and history cursor of this process run (``epoch``)"""
+    selected_interface = state['selected_interface']
+    history = interface_histories.get(selected_interface)
+    # Only samples the state version points at; later appends may be in progress
+    history_cursor = state['interfaces'].get(selected_interface, {}).get('history_cursor', 0)
+    
+    # Cursors from another process run or another interface need a full reload
+    if (since is None or epoch != STATE_EPOCH or since > state.version or cursor > history_cursor
+            or state.field_versions['selected_interface'] > since):
+        payload = dict(
+            json_safe_fields(state.data),
+            performance_history=history.to_records(HISTORY_API_ENTRIES, history_cursor) if history else [],
+            history_memory=get_history_memory(),
+            full=True
+        )
+    else:
+        new_samples = min(history_cursor - cursor, HISTORY_API_ENTRIES)
+        payload = {
+            'changed': json_safe_fields(state.changed_since(since)),
+            'performance_history': history.to_records(new_samples, history_cursor) if history and new_samples else [],
+            'full': False
+        }
+    
+    payload.update(version=state.version, history_cursor=history_cursor, epoch=STATE_EPOCH)
+    return payload
+
+def encoded_response(encoded, etag):
+    """Return pre-encoded JSON, compressed as the client allows"""
+    body, encoding = encoded.select(request.headers.get('Accept-Encoding'))
+    response = Response(body, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(etag, weak=True)
+    return response
+
 @app.route('/api/status')
 def api_status():
-    """API endpoint for monitoring data"""
-    return jsonify(monitoring_data)
+    """API endpoint for monitoring data
+
+    Clients that pass ?since=<version>&history_cursor=<cursor>&epoch=<epoch>
+    from an earlier response of this process run get only the fields and
+    history samples that changed; an If-None-Match matching the current
+    version gets a 304.
+    """
+    snapshot = status_snapshot or publish_state()
+    
+    if request.if_none_match.contains_weak(snapshot.etag):
+        response = make_response('', 304)
+        response.set_etag(snapshot.etag, weak=True)
+        return response
+    
+    try:
+        since = int(request.args['since'])
+        cursor = int(request.args.get('history_cursor', 0))
+    except (KeyError, ValueError):
+        since, cursor = None, 0
+    epoch = request.args.get('epoch')
+    
+    # Most requests are served from the bytes encoded at publish time
+    if since is None:
+        return encoded_response(snapshot.full, snapshot.etag)
+    if snapshot.matches_delta(since, cursor, epoch):
+        return encoded_response(snapshot.delta, snapshot.etag)
+    
+    state = monitoring_state.current
+    return encoded_response(EncodedPayload(build_status_payload(state, since, cursor, epoch)),
+                            f'{STATE_EPOCH}-v{state.version}')
+
+@app.route('/api/stream')
+def api_stream():
+    """Push monitor ticks and speed-test results as Server-Sent Events"""
+    subscriber = broadcaster.subscribe()
+    if subscriber is None:
+        return jsonify({'success': False, 'message': 'Too many stream subscribers'}), 503
+    
+    # Start every stream from a full snapshot; deltas follow in order (the
+    # dashboard skips a queued delta the snapshot already includes)
+    snapshot = status_snapshot or publish_state()
+    first_message = encode_event('status', snapshot.full.body, snapshot.version)
+    
+    response = Response(broadcaster.stream(subscriber, first_message), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/scheduler')
+def api_scheduler():
+    """Run accounting for the recurring jobs"""
+    return jsonify({'jobs': scheduler.status()})
 
 @app.route('/api/interfaces')
 def get_interfaces():
@@ -533,42 +1356,165 @@ def get_interfaces():
 
 @app.route('/api/select-interface', methods=['POST'])
 def select_interface():
-    """Select a network interface to monitor"""
-    global monitoring_data
+    """Select which monitored interface the dashboard shows"""
     data = request.get_json()
     interface_name = data.get('interface_name')
     
     if interface_name:
         # Verify interface exists
-        interfaces = psutil.net_if_addrs()
-        if interface_name in interfaces:
-            monitoring_data['selected_interface'] = interface_name
-            return jsonify({'success': True, 'message': f'Switched to interface: {interface_name}'})
+        if interface_name in interface_inventory.snapshot.addresses:
+            update_state(lambda state: dict(
+                selected_view(state['interfaces'], interface_name),
+                selected_interface=interface_name
+            ))
+            return jsonify({'success': True, 'message': f'Now viewing interface: {interface_name}'})
         else:
             return jsonify({'success': False, 'message': 'Interface not found'})
     else:
         return jsonify({'success': False, 'message': 'No interface specified'})
 
+@app.route('/api/history')
+def api_history():
+    """Read stored probe samples or speed tests for a time range"""
+    if store is None:
+        return jsonify({'success': False, 'message': 'History store not open'})
+    
+    try:
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - 3600))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'start and end must be epoch seconds'})
+    
+    series = store.speed_tests if request.args.get('series') == 'speedtest' else store.probes
+    records = []
+    for record in series.records(start, end):
+        if len(records) >= HISTORY_QUERY_LIMIT:
+            break
+        records.append({
+            key: None if isinstance(value, float) and math.isnan(value) else value
+            for key, value in record.items()
+        })
+    
+    return jsonify({'success': True, 'records': records})
+
+@app.route('/api/rollups')
+def api_rollups():
+    """Read pre-aggregated buckets for one metric and resolution"""
+    metric = request.args.get('metric', 'latency')
+    if metric not in ROLLUP_METRICS:
+        return jsonify({'success': False, 'message': f'Unknown metric: {metric}'})
+    
+    try:
+        resolution = int(request.args.get('resolution', 60))
+        end = float(request.args.get('end', time.time()))
+        start = float(request.args.get('start', end - 24 * 3600))
+        rows = rollups.query(metric, resolution, start, end)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
+    
+    return jsonify({'success': True, 'metric': metric, 'resolution': resolution, 'rows': rows})
+
+@app.route('/api/probe-targets', methods=['GET', 'POST'])
+def probe_targets():
+    """Get or replace the extra hosts probed every tick"""
+    if request.method == 'GET':
+        return jsonify({'targets': monitoring_state.current['probe_targets']})
+    
+    data = request.get_json()
+    targets = data.get('targets')
+    
+    if isinstance(targets, list) and all(isinstance(host, str) for host in targets):
+        # Resolve here so monitor ticks only read cached addresses
+        unresolved = [host for host, address in host_resolver.refresh(dict.fromkeys(targets)).items()
+                      if address is None]
+        state = update_state({'probe_targets': list(dict.fromkeys(targets))})
+        return jsonify({'success': True, 'message': f"Probing {len(state['probe_targets'])} extra targets",
+                        'unresolved': unresolved})
+    else:
+        return jsonify({'success': False, 'message': 'Targets must be a list of hosts'})
+
+@app.route('/api/speed-test', methods=['POST'])
+def start_speed_test():
+    """Start a speed test job, or attach to the one already running
+
+    An optional JSON body {"mode": "standard" | "saturation"} picks the test.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        job, started = speed_tests.start('manual', data.get('mode', 'standard'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'started': started, 'job': job.to_dict()}), 202
+
+@app.route('/api/speed-test/<job_id>')
+def get_speed_test(job_id):
+    """Poll a speed test job; ?since=<n> returns only progress events from n on"""
+    job = speed_tests.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown speed test job'}), 404
+    
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        since = 0
+    return jsonify({'success': True, 'job': job.to_dict(since)})
+
+@app.route('/api/speed-test/<job_id>/stream')
+def stream_speed_test(job_id):
+    """Stream a speed test job's progress as Server-Sent Events, then its result"""
+    job = speed_tests.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown speed test job'}), 404
+    
+    def generate():
+        seen = 0
+        while True:
+            events, done = job.wait_for_events(seen, KEEPALIVE_INTERVAL)
+            for event in events:
+                yield encode_event('progress', event, event['seq'])
+            seen += len(events)
+            if done:
+                yield encode_event(job.status, {'result': job.result, 'error': job.error})
+                return
+            if not events:
+                yield b': keepalive\n\n'
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/run-speed-test')
 def api_run_speed_test():
-    """Run a speed test"""
-    try:
-        speed_result = run_speed_test()
-        monitoring_data['fast_com_speed'] = speed_result
-        monitoring_data['last_fast_com_test'] = datetime.now().isoformat()
-        return jsonify({'success': True, 'result': speed_result})
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)})
+    """Run a speed test and wait for its result (joins a test already running)"""
+    job, _ = speed_tests.start('manual')
+    job.wait()
+    if job.error is not None:
+        return jsonify({'success': False, 'error': job.error})
+    return jsonify({'success': True, 'result': job.result})
 
 @app.route('/api/reset-metrics')
 def reset_metrics():
     """Reset performance metrics"""
-    global monitoring_data
-    monitoring_data['worst_latency'] = 0
-    monitoring_data['best_bandwidth'] = 0
-    monitoring_data['worst_bandwidth'] = float('inf')
-    monitoring_data['performance_history'] = []
-    monitoring_data['downtime_count'] = 0
+    def apply_reset(state):
+        # Under the write lock, so a monitor tick can't refill them halfway
+        for history in interface_histories.values():
+            history.clear()
+        for sketch in latency_sketches.values():
+            sketch.reset()
+        return {
+            'worst_latency': 0,
+            'best_bandwidth': 0,
+            'worst_bandwidth': float('inf'),
+            'interfaces': {
+                name: dict(interface_state, downtime_count=0)
+                for name, interface_state in state['interfaces'].items()
+            },
+            'latency_percentiles': {},
+            'downtime_count': 0
+        }
+    
+    update_state(apply_reset)
     return jsonify({'success': True, 'message': 'Metrics reset'})
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+"""
+Fixed-capacity columnar ring buffer for performance history
+Timestamps, latency and bandwidth live in preallocated typed arrays
+"""
+
+import math
+from array import array
+from datetime import datetime
+
+COLUMNS = ('timestamp', 'latency', 'bandwidth')
+
+
+class RingBuffer:
+    """Columnar ring buffer with O(1) append and zero-copy slice views"""
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.latency = array('d', bytes(8 * capacity))
+        self.bandwidth = array('d', bytes(8 * capacity))
+        self.total = 0  # Samples ever appended, used as a cursor
+        self.first = 0  # Cursor of the oldest sample still held
+
+    @property
+    def head(self):
+        """Next slot to write"""
+        return self.total % self.capacity
+
+    @property
+    def count(self):
+        return self.total - self.first
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, latency, bandwidth):
+        """Append one sample (latency None is stored as NaN), overwriting the oldest
+
+        The sample is written before ``total`` moves past it, so a reader
+        holding an earlier cursor never sees a partly written slot.
+        """
+        slot = self.head
+        self.timestamps[slot] = timestamp
+        self.latency[slot] = math.nan if latency is None else latency
+        self.bandwidth[slot] = bandwidth
+        self.total += 1
+        if self.total - self.first > self.capacity:
+            self.first = self.total - self.capacity
+
+    def clear(self):
+        """Forget all samples without releasing the arrays"""
+        self.first = self.total
+
+    def _ranges(self, last=None, upto=None):
+        """Index ranges (oldest first) covering the newest ``last`` samples before cursor ``upto``"""
+        end = self.total if upto is None else min(upto, self.total)
+        available = max(0, end - self.first)
+        n = available if last is None else max(0, min(last, available))
+        if n == 0:
+            return []
+        start = (end - n) % self.capacity
+        stop = end % self.capacity
+        if start + n <= self.capacity:
+            return [(start, start + n)]
+        return [(start, self.capacity), (0, stop)]
+
+    def views(self, last=None, upto=None):
+        """Return zero-copy memoryview segments of the newest samples
+
+        The result is a list of one or two dicts (two when the range wraps),
+        each mapping a column name to a memoryview of doubles. ``upto``
+        limits the result to samples appended before that cursor.
+        """
+        columns = (memoryview(self.timestamps), memoryview(self.latency), memoryview(self.bandwidth))
+        return [
+            {name: column[start:end] for name, column in zip(COLUMNS, columns)}
+            for start, end in self._ranges(last, upto)
+        ]
+
+    def since(self, cursor):
+        """Return the views appended after a ``total`` cursor, plus the new cursor"""
+        return self.views(self.total - cursor if cursor < self.total else 0), self.total
+
+    def to_records(self, last=None, upto=None):
+        """Return the newest samples (before cursor ``upto``) as JSON-friendly dicts"""
+        records = []
+        for segment in self.views(last, upto):
+            for ts, latency, bandwidth in zip(segment['timestamp'], segment['latency'], segment['bandwidth']):
+                records.append({
+                    'timestamp': datetime.fromtimestamp(ts).isoformat(),
+                    'latency': None if math.isnan(latency) else latency,
+                    'bandwidth': bandwidth
+                })
+        return records
+
+    def bytes_per_sample(self):
+        """Memory used by one sample across all columns"""
+        return self.timestamps.itemsize + self.latency.itemsize + self.bandwidth.itemsize
+
+    def memory_usage(self):
+        """Summarize the buffer's memory footprint"""
+        return {
+            'capacity': self.capacity,
+            'samples': self.count,
+            'bytes_per_sample': self.bytes_per_sample(),
+            'memory_bytes': self.bytes_per_sample() * self.capacity
+        }
@@ -0,0 +1,308 @@
+"""
+Streaming HTTP throughput test
+Bodies are read chunk by chunk into one reused buffer per connection and
+every chunk is timestamped, so the rate covers the transfer itself rather
+than the time to headers. Uploads are streamed as memoryview slices of one
+shared payload. All connections come from one pooled Session.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from throughput import get_pattern
+
+CHUNK_SIZE = 256 * 1024  # recv buffer per connection
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes handed to the socket per upload write
+MAX_CONNECTIONS = 16  # Parallel connections per test, and the pool size per host
+
+_session = None
+_session_lock = threading.Lock()
+_buffers = threading.local()  # One receive buffer per worker thread, reused across tests
+_pool = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix='http-test')
+
+
+def get_session():
+    """The process-wide pooled Session, created on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def get_buffer():
+    """This thread's receive buffer"""
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = bytearray(CHUNK_SIZE)
+    return buffer
+
+
+def download(url, session=None, timeout=30, stop=None, counter=None, index=0):
+    """Stream one response body; return its size and per-chunk timing
+
+    Returns {'bytes', 'requested', 'headers', 'finished', 'chunks'} where the
+    times are perf_counter values and ``chunks`` is a list of
+    (time, bytes) pairs. Reading stops early when ``stop`` is set.
+    ``counter[index]`` is kept up to date for live rate sampling.
+    """
+    session = session or get_session()
+    view = memoryview(get_buffer())
+    requested = time.perf_counter()
+    with session.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        headers = time.perf_counter()
+        raw = response.raw
+        received = 0
+        chunks = []
+        while stop is None or not stop.is_set():
+            count = raw.readinto(view)
+            if not count:
+                break
+            received += count
+            chunks.append((time.perf_counter(), count))
+            if counter is not None:
+                counter[index] = received
+    return {
+        'bytes': received,
+        'requested': requested,
+        'headers': headers,
+        'finished': chunks[-1][0] if chunks else headers,
+        'chunks': chunks
+    }
+
+
+class UploadStopped(Exception):
+    """Raised inside an upload body to abandon the request early"""
+
+
+class UploadBody:
+    """Request body of ``size`` bytes streamed from the shared payload
+
+    Iterating yields memoryview slices of the payload (no copies, nothing
+    allocated per test) and timestamps each one once the socket has taken
+    it. Having a length, the body is sent with Content-Length rather than
+    chunked framing, so the slices go to the socket as they are.
+    """
+
+    def __init__(self, size, stop=None, counter=None, index=0):
+        self.size = size
+        self.stop = stop
+        self.counter = counter
+        self.index = index
+        self.sent = 0
+        self.started = None
+        self.chunks = []
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        view = get_pattern().view
+        offset = 0
+        self.started = time.perf_counter()
+        while self.sent < self.size:
+            if self.stop is not None and self.stop.is_set():
+                raise UploadStopped()
+            count = min(UPLOAD_CHUNK_SIZE, self.size - self.sent, len(view) - offset)
+            yield view[offset:offset + count]
+            self.sent += count
+            offset = (offset + count) % len(view)
+            self.chunks.append((time.perf_counter(), count))
+            if self.counter is not None:
+                self.counter[self.index] = self.sent
+
+
+def upload(url, size, session=None, timeout=30, stop=None, counter=None, index=0):
+    """POST ``size`` bytes to ``url``; return what was sent and per-chunk timing
+
+    Returns {'bytes', 'requested', 'started', 'finished', 'complete',
+    'chunks'}. A complete upload finishes when the response arrives (the
+    server has everything); one cut short by ``stop`` finishes at its last
+    chunk and its connection is dropped.
+    """
+    session = session or get_session()
+    body = UploadBody(size, stop, counter, index)
+    requested = time.perf_counter()
+    complete = False
+    try:
+        with session.post(url, data=body, timeout=timeout,
+                          headers={'Content-Type': 'application/octet-stream'}) as response:
+            response.raise_for_status()
+            complete = True
+    except UploadStopped:
+        pass
+    finished = time.perf_counter() if complete else (body.chunks[-1][0] if body.chunks else requested)
+    return {
+        'bytes': body.sent,
+        'requested': requested,
+        'started': body.started or requested,
+        'finished': finished,
+        'complete': complete,
+        'chunks': body.chunks
+    }
+
+
+def sample_transfers(transfer, args, connections, max_seconds, on_interval, interval):
+    """Run ``transfer(*args, stop, counters, index)`` on parallel connections
+
+    Samples the shared byte counters once per interval while they run and
+    sets ``stop`` after ``max_seconds``. Returns (results, intervals);
+    raises if any connection fails.
+    """
+    stop = threading.Event()
+    counters = [0] * connections
+    futures = [_pool.submit(transfer, *args, stop, counters, index)
+               for index in range(connections)]
+
+    intervals = []
+    started = time.perf_counter()
+    previous = 0
+    tick = started
+    while not all(future.done() for future in futures):
+        tick += interval
+        if max_seconds is not None and tick - started > max_seconds:
+            stop.set()
+        wait(futures, max(0, tick - time.perf_counter()))
+        if time.perf_counter() < tick:
+            continue
+        current = sum(counters)
+        sample = {
+            'start': round(tick - interval - started, 2),
+            'end': round(tick - started, 2),
+            'mbps': round((current - previous) * 8 / interval / 1e6, 2)
+        }
+        previous = current
+        intervals.append(sample)
+        if on_interval is not None:
+            on_interval(sample)
+
+    return [future.result() for future in futures], intervals
+
+
+def run_download(url, connections=1, timeout=30, max_seconds=None, on_interval=None, interval=1.0):
+    """Download ``url`` over parallel connections and measure the aggregate rate
+
+    Every connection fetches the whole body. The rate runs from the first
+    response's headers to the last chunk, so connection setup and server
+    think time are left out (reported as ``ttfb``). Returns {'mbps',
+    'bytes', 'duration', 'ttfb', 'connections', 'intervals'}; raises if any
+    connection fails.
+    """
+    connections = max(1, min(connections, MAX_CONNECTIONS))
+    results, intervals = sample_transfers(download, (url, get_session(), timeout),
+                                          connections, max_seconds, on_interval, interval)
+    first = min(result['headers'] for result in results)
+    last = max(result['finished'] for result in results)
+    total = sum(result['bytes'] for result in results)
+    duration = last - first
+    return {
+        'mbps': round(total * 8 / duration / 1e6, 2) if duration > 0 else 0.0,
+        'bytes': total,
+        'duration': round(duration, 3),
+        'ttfb': round(min(result['headers'] - result['requested'] for result in results), 3),
+        'connections': connections,
+        'intervals': intervals
+    }
+
+
+def run_upload(url, size, connections=1, timeout=30, max_seconds=None, on_interval=None, interval=1.0):
+    """Upload ``size`` bytes in total to ``url``, split over parallel connections
+
+    Sizes from a few MB to many GB cost the same memory. The rate runs from
+    the first body byte to the last acknowledged (or, when cut short by
+    ``max_seconds``, last sent) chunk. Returns {'mbps', 'bytes', 'duration',
+    'complete', 'connections', 'intervals'}; raises if any connection fails.
+    """
+    connections = max(1, min(connections, MAX_CONNECTIONS, size))
+    share, extra = divmod(size, connections)
+    session = get_session()
+
+    def upload_share(stop, counters, index):
+        return upload(url, share + (1 if index < extra else 0), session, timeout, stop, counters, index)
+
+    results, intervals = sample_transfers(upload_share, (), connections, max_seconds, on_interval, interval)
+    first = min(result['started'] for result in results)
+    last = max(result['finished'] for result in results)
+    total = sum(result['bytes'] for result in results)
+    duration = last - first
+    return {
+        'mbps': round(total * 8 / duration / 1e6, 2) if duration > 0 else 0.0,
+        'bytes': total,
+        'duration': round(duration, 3),
+        'complete': all(result['complete'] for result in results),
+        'connections': connections,
+        'intervals': intervals
+    }
+
+
+class SinkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        """Read and discard the body; reply with the number of bytes received"""
+        buffer = memoryview(get_buffer())
+        received = 0
+        try:
+            if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        break
+                    received += self.discard(buffer, size)
+                    self.rfile.readline()
+            else:
+                received = self.discard(buffer, int(self.headers.get('Content-Length') or 0))
+            body = str(received).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (OSError, ValueError):
+            # Client went away early (e.g. cut short by max_seconds) or sent bad framing
+            self.close_connection = True
+
+    def discard(self, buffer, size):
+        received = 0
+        while received < size:
+            count = self.rfile.readinto(buffer[:min(len(buffer), size - received)])
+            if not count:
+                break
+            received += count
+        return received
+
+
+class SinkServer:
+    """HTTP server that accepts upload tests on a daemon thread"""
+
+    def __init__(self, host='0.0.0.0', port=0):
+        self.server = ThreadingHTTPServer((host, port), SinkHandler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True, name='upload-sink')
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,257 @@
+"""
+Batched ICMP echo prober
+Keeps one ICMP socket open and sweeps many targets with all echo
+requests in flight at once
+"""
+
+import itertools
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+DEFAULT_PAYLOAD_SIZE = 56
+RECEIVE_BUFFER_SIZE = 1024 * 1024  # Room for a full sweep of replies
+RESOLVE_TTL = 300  # Seconds a resolved address is reused before it is looked up again
+RESOLVE_NEGATIVE_TTL = 30  # Seconds a failed lookup is remembered
+
+_raw_idents = itertools.count(os.getpid())
+
+
+def icmp_checksum(data):
+    """Compute the Internet checksum of a byte string"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(ident, seq, payload):
+    """Build an ICMP echo request packet"""
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = icmp_checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+def is_ipv4_address(host):
+    try:
+        socket.inet_pton(socket.AF_INET, host)
+        return True
+    except OSError:
+        return False
+
+
+class HostResolver:
+    """IPv4 lookups cached with a TTL; failed lookups are cached for a shorter time
+
+    ``refresh`` resolves right away and ``resolve`` when the cache has no
+    fresh answer (for callers that can wait, like an API request setting
+    new targets). ``lookup`` never blocks: it answers from
+    the cache and refreshes an expired or missing entry on a background
+    thread, serving the stale address meanwhile.
+    """
+
+    def __init__(self, ttl=RESOLVE_TTL, negative_ttl=RESOLVE_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = {}  # Host -> (address or None, expiry time)
+        self.refreshing = set()
+        self.lock = threading.Lock()
+
+    def _resolve(self, host):
+        try:
+            address = socket.gethostbyname(host)
+        except OSError as e:
+            print(f"Resolve error for {host}: {e}")
+            address = None
+        expires = time.monotonic() + (self.ttl if address is not None else self.negative_ttl)
+        with self.lock:
+            self.entries[host] = (address, expires)
+            self.refreshing.discard(host)
+        return address
+
+    def refresh(self, hosts):
+        """Resolve hosts now; return {host: address or None}"""
+        return {host: host if is_ipv4_address(host) else self._resolve(host) for host in hosts}
+
+    def resolve(self, host):
+        """Cached address of a host while it is fresh, otherwise resolve it now"""
+        if is_ipv4_address(host):
+            return host
+        with self.lock:
+            address, expires = self.entries.get(host, (None, 0))
+        if expires > time.monotonic():
+            return address
+        return self._resolve(host)
+
+    def lookup(self, host):
+        """Cached address of a host, or None while it is unknown or unresolvable"""
+        if is_ipv4_address(host):
+            return host
+        with self.lock:
+            address, expires = self.entries.get(host, (None, 0))
+            if expires > time.monotonic() or host in self.refreshing:
+                return address
+            self.refreshing.add(host)
+        threading.Thread(target=self._resolve, args=(host,), daemon=True, name='resolve').start()
+        return address
+
+
+class IcmpProber:
+    """Single-socket ICMP prober that matches replies by id and sequence"""
+
+    def __init__(self, resolver=None):
+        self.sock, self.mode = self._open_socket()
+        if self.mode == 'dgram':
+            # The kernel assigns the echo id from the socket's local port
+            self.sock.bind(('', 0))
+            self.ident = self.sock.getsockname()[1]
+        else:
+            # Raw sockets see every reply, so each prober needs its own id
+            self.ident = next(_raw_idents) & 0xFFFF
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+        self.sock.setblocking(False)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.resolver = resolver or HostResolver()
+
+    @staticmethod
+    def _open_socket():
+        """Open an unprivileged datagram ICMP socket, or a raw one as fallback"""
+        try:
+            return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), 'dgram'
+        except (PermissionError, OSError):
+            return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), 'raw'
+
+    def _next_seq(self):
+        self.seq = (self.seq + 1) & 0xFFFF
+        return self.seq
+
+    def _parse_reply(self, packet):
+        """Return the (id, seq) of an echo reply, or None for anything else"""
+        if self.mode == 'raw':
+            header_length = (packet[0] & 0x0F) * 4
+            packet = packet[header_length:]
+        if len(packet) < 8:
+            return None
+        icmp_type, _, _, ident, seq = struct.unpack('!BBHHH', packet[:8])
+        if icmp_type != ICMP_ECHO_REPLY:
+            return None
+        # Datagram sockets only deliver replies for this socket
+        if self.mode == 'raw' and ident != self.ident:
+            return None
+        return ident, seq
+
+    def sweep(self, hosts, timeout=1.0, payload_size=DEFAULT_PAYLOAD_SIZE, count=1):
+        """Send echo requests to every host at once and return RTTs in ms
+
+        Each host gets ``count`` echoes; the result maps host to a list of
+        RTTs (None for lost echoes) when count > 1, otherwise to one RTT.
+        Hosts are looked up in the resolver's cache, never resolved here;
+        one without a cached address counts as lost.
+        """
+        payload = bytes(payload_size)
+        results = {host: [None] * count for host in hosts}
+        addresses = {host: self.resolver.lookup(host) for host in hosts}
+
+        with self.lock:
+            pending = {}
+
+            # Fire every request before reading any reply
+            for index in range(count):
+                for host, address in addresses.items():
+                    if address is None:
+                        continue
+                    seq = self._next_seq()
+                    packet = build_echo_request(self.ident, seq, payload)
+                    pending[seq] = (host, index, time.perf_counter())
+                    try:
+                        self.sock.sendto(packet, (address, 0))
+                    except OSError as e:
+                        print(f"ICMP send error for {host}: {e}")
+                        pending.pop(seq, None)
+
+            deadline = time.perf_counter() + timeout
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                readable, _, _ = select.select([self.sock], [], [], remaining)
+                if not readable:
+                    break
+                while True:
+                    try:
+                        packet = self.sock.recv(65535)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    received = time.perf_counter()
+                    reply = self._parse_reply(packet)
+                    if reply is None or reply[1] not in pending:
+                        continue
+                    host, index, sent = pending.pop(reply[1])
+                    results[host][index] = round((received - sent) * 1000, 2)
+
+        if count == 1:
+            return {host: rtts[0] for host, rtts in results.items()}
+        return results
+
+    def size_sweep(self, host, sizes, timeout=1.0, count=5):
+        """Send a train of ``count`` echoes at each payload size; return {size: RTTs}
+
+        Sizes go one train at a time so they don't queue behind each other;
+        each train returns as soon as its last reply arrives.
+        """
+        return {size: self.sweep([host], timeout, payload_size=size, count=count)[host] for size in sizes}
+
+    def close(self):
+        """Close the prober socket"""
+        self.sock.close()
+
+
+def fit_serialization_delay(samples):
+    """Fit the minimum RTT per payload size to a line
+
+    ``samples`` maps payload size to a list of RTTs in ms (None for lost
+    echoes). The minimum per size strips out queueing; the slope is the
+    per-byte delay of carrying the payload out and back, and its inverse the
+    rate of the slowest link counted in both directions (a lower bound on
+    the bottleneck rate). Returns None with fewer than two sizes answered.
+    """
+    points = [(size, min(rtt for rtt in rtts if rtt is not None))
+              for size, rtts in sorted(samples.items()) if any(rtt is not None for rtt in rtts)]
+    if len(points) < 2:
+        return None
+
+    n = len(points)
+    mean_size = sum(size for size, _ in points) / n
+    mean_rtt = sum(rtt for _, rtt in points) / n
+    spread = sum((size - mean_size) ** 2 for size, _ in points)
+    if spread == 0:
+        return None
+    slope = sum((size - mean_size) * (rtt - mean_rtt) for size, rtt in points) / spread
+    intercept = mean_rtt - slope * mean_size
+    total = sum((rtt - mean_rtt) ** 2 for _, rtt in points)
+    residual = sum((rtt - intercept - slope * size) ** 2 for size, rtt in points)
+
+    return {
+        'points': [{'size': size, 'min_rtt_ms': rtt} for size, rtt in points],
+        'base_rtt_ms': round(intercept, 3),
+        'per_byte_us': round(slope * 1000, 4),
+        'bottleneck_mbps': round(8 / (slope / 1000) / 1e6, 2) if slope > 0 else None,
+        'r_squared': round(1 - residual / total, 3) if total > 0 else None
+    }
+
+
+def open_prober(resolver=None):
+    """Open a shared ICMP prober, or return None when ICMP sockets are not allowed"""
+    try:
+        return IcmpProber(resolver)
+    except OSError as e:
+        print(f"ICMP prober unavailable, using per-host pings: {e}")
+        return None
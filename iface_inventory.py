@@ -0,0 +1,161 @@
+"""
+Cached network interface inventory
+One shared snapshot of interface addresses and link state, refreshed by
+netlink link/address events on Linux and by polling elsewhere
+"""
+
+import socket
+import struct
+import threading
+import time
+
+import psutil
+
+# rtnetlink multicast groups and message types (linux/rtnetlink.h)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+NLMSG_HEADER = struct.Struct('=IHHII')
+INTERFACE_EVENTS = (RTM_NEWLINK, RTM_DELLINK, RTM_NEWADDR, RTM_DELADDR)
+
+
+class InventorySnapshot:
+    """Immutable view of the interfaces at one point in time"""
+
+    def __init__(self, addresses, stats, interfaces, version):
+        self.addresses = addresses    # name -> psutil address list
+        self.stats = stats            # name -> psutil link stats (isup, speed, mtu)
+        self.interfaces = interfaces  # Summary list served to the dashboard
+        self.version = version
+        self.timestamp = time.time()
+
+    def is_up(self, name):
+        """Link state of an interface (True when the platform doesn't report it)"""
+        stats = self.stats.get(name)
+        return stats.isup if stats is not None else True
+
+
+class InterfaceInventory:
+    """Interface cache shared by the monitor loop and the API handlers"""
+
+    def __init__(self, summarize, poll_interval=5, safety_interval=60):
+        self.summarize = summarize  # Builds the dashboard list from an address map
+        self.poll_interval = poll_interval
+        self.safety_interval = safety_interval
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.version = 0
+        self._snapshot = None
+        self.mode = None
+        self.thread = None
+
+    @property
+    def snapshot(self):
+        """Current snapshot; refreshed on read while no watcher thread runs"""
+        snapshot = self._snapshot
+        if snapshot is None or (self.thread is None and time.time() - snapshot.timestamp > self.poll_interval):
+            snapshot = self.refresh()
+        return snapshot
+
+    def refresh(self):
+        """Rebuild the snapshot and notify listeners"""
+        with self.lock:
+            addresses = psutil.net_if_addrs()
+            try:
+                stats = psutil.net_if_stats()
+            except OSError:
+                stats = {}
+            self.version += 1
+            snapshot = InventorySnapshot(addresses, stats, self.summarize(addresses), self.version)
+            self._snapshot = snapshot
+        for listener in self.listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                print(f"Interface inventory listener error: {e}")
+        return snapshot
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Interface inventory refresh error: {e}")
+
+    def add_listener(self, listener):
+        """Call listener(snapshot) after every refresh"""
+        self.listeners.append(listener)
+
+    def start(self):
+        """Start watching for interface changes"""
+        if self.thread is not None:
+            return
+        sock = self._open_netlink()
+        if sock is not None:
+            self.mode = 'netlink'
+            target = lambda: self._watch_netlink(sock)
+        else:
+            self.mode = 'poll'
+            target = self._poll
+        self.thread = threading.Thread(target=target, daemon=True, name='iface-inventory')
+        self.thread.start()
+
+    @staticmethod
+    def _open_netlink():
+        if not hasattr(socket, 'AF_NETLINK'):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            return sock
+        except OSError as e:
+            print(f"Netlink unavailable, polling interfaces: {e}")
+            return None
+
+    @staticmethod
+    def _has_interface_event(data):
+        offset = 0
+        while offset + NLMSG_HEADER.size <= len(data):
+            length, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+            if msg_type in INTERFACE_EVENTS:
+                return True
+            if length < NLMSG_HEADER.size:
+                break
+            offset += (length + 3) & ~3  # Messages are 4-byte aligned
+        return False
+
+    def _watch_netlink(self, sock):
+        sock.settimeout(self.safety_interval)
+        while True:
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                # Periodic refresh in case an event was dropped
+                self._refresh_quietly()
+                continue
+            except OSError as e:
+                # ENOBUFS means events were lost; resync from scratch
+                print(f"Netlink receive error, refreshing interfaces: {e}")
+                self._refresh_quietly()
+                continue
+
+            changed = self._has_interface_event(data)
+            # Drain the burst that usually accompanies one change
+            sock.setblocking(False)
+            try:
+                while True:
+                    changed = self._has_interface_event(sock.recv(65536)) or changed
+            except OSError:
+                pass
+            sock.settimeout(self.safety_interval)
+
+            if changed:
+                self._refresh_quietly()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self._refresh_quietly()
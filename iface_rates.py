@@ -0,0 +1,150 @@
+"""
+High-resolution interface rate sampler
+Reads per-NIC byte counters on a fixed interval and turns the deltas into
+receive/transmit rates
+"""
+
+import os
+import threading
+import time
+
+import psutil
+
+PROC_NET_DEV = '/proc/net/dev'
+MIN_INTERVAL = 0.1  # Seconds; faster sampling mostly measures scheduler jitter
+COUNTER_32_MAX = 2 ** 32
+DEFAULT_LINK_MBPS = 10000  # Assumed link speed when the driver doesn't report one
+LINK_SPEED_REFRESH = 10  # Seconds between link speed reads when no inventory supplies them
+
+
+def read_proc_net_dev(path=PROC_NET_DEV):
+    """Read {interface: (rx_bytes, tx_bytes)} straight from /proc/net/dev"""
+    counters = {}
+    with open(path, 'rb') as f:
+        lines = f.read().split(b'\n')[2:]  # Skip the two header lines
+    for line in lines:
+        name, sep, fields = line.partition(b':')
+        if not sep:
+            continue
+        fields = fields.split()
+        counters[name.strip().decode()] = (int(fields[0]), int(fields[8]))
+    return counters
+
+
+def read_psutil_counters():
+    """Read {interface: (rx_bytes, tx_bytes)} through psutil"""
+    return {
+        name: (stats.bytes_recv, stats.bytes_sent)
+        for name, stats in psutil.net_io_counters(pernic=True).items()
+    }
+
+
+def read_link_speeds():
+    """Read {interface: link speed in Mbps} for the interfaces that report one"""
+    try:
+        return {name: stats.speed for name, stats in psutil.net_if_stats().items() if stats.speed > 0}
+    except OSError as e:
+        print(f"Error reading link speeds: {e}")
+        return {}
+
+
+def counter_delta(previous, current, max_delta=None):
+    """Bytes between two counter readings, or None when the counter was reset
+
+    A decrease only counts as a 32-bit wrap when the wrapped delta is no
+    more than ``max_delta`` (what the link could carry in the interval),
+    which also means ``previous`` was close to 2**32. Anything else is a
+    reset and the reading becomes the new baseline.
+    """
+    if current >= previous:
+        return current - previous
+    if max_delta is None:
+        max_delta = DEFAULT_LINK_MBPS * 1e6 / 8
+    wrapped = current + COUNTER_32_MAX - previous
+    if previous < COUNTER_32_MAX and wrapped <= max_delta:
+        return wrapped
+    return None
+
+
+class RateSampler:
+    """Background sampler publishing per-interface rx/tx rates"""
+
+    def __init__(self, interval=1.0, link_speeds=None):
+        self.interval = max(interval, MIN_INTERVAL)
+        # Callable returning {interface: Mbps}, e.g. from an interface inventory
+        # snapshot; otherwise speeds are read here every LINK_SPEED_REFRESH seconds
+        self.link_speeds = link_speeds or self._cached_link_speeds
+        self.cached_speeds = {}
+        self.speeds_read = None
+        if os.path.exists(PROC_NET_DEV):
+            self.read_counters = read_proc_net_dev
+        else:
+            self.read_counters = read_psutil_counters
+        self.previous = {}  # interface -> (rx_bytes, tx_bytes, perf_counter)
+        self.rates = {}  # Replaced wholesale so readers never see a partial update
+        self.thread = None
+        self.running = False
+
+    def _cached_link_speeds(self):
+        now = time.monotonic()
+        if self.speeds_read is None or now - self.speeds_read >= LINK_SPEED_REFRESH:
+            self.cached_speeds = read_link_speeds()
+            self.speeds_read = now
+        return self.cached_speeds
+
+    def sample(self):
+        """Take one counter snapshot and update the rates"""
+        counters = self.read_counters()
+        now = time.perf_counter()
+        wall = time.time()
+        link_speeds = self.link_speeds()
+        rates = {}
+
+        for name, (rx, tx) in counters.items():
+            rate = {'rx': rx, 'tx': tx, 'rx_bps': 0.0, 'tx_bps': 0.0, 'timestamp': wall}
+            previous = self.previous.get(name)
+            if previous is not None:
+                elapsed = now - previous[2]
+                max_delta = (link_speeds.get(name) or DEFAULT_LINK_MBPS) * 1e6 / 8 * elapsed
+                rx_delta = counter_delta(previous[0], rx, max_delta)
+                tx_delta = counter_delta(previous[1], tx, max_delta)
+                # After a counter reset this reading only becomes the new baseline
+                if elapsed > 0 and rx_delta is not None and tx_delta is not None:
+                    rate['rx_bps'] = rx_delta / elapsed
+                    rate['tx_bps'] = tx_delta / elapsed
+            rates[name] = rate
+
+        # Interfaces that disappeared lose their baseline
+        self.previous = {name: (rx, tx, now) for name, (rx, tx) in counters.items()}
+        self.rates = rates
+        return rates
+
+    def get(self, interface_name):
+        """Latest counters and rates for one interface, or None"""
+        return self.rates.get(interface_name)
+
+    def start(self):
+        """Start sampling on a daemon thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name='rate-sampler')
+        self.thread.start()
+
+    def _run(self):
+        next_sample = time.perf_counter()
+        while self.running:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Rate sampler error: {e}")
+            # Fixed-rate schedule so the interval does not drift
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.perf_counter()
+
+    def stop(self):
+        self.running = False
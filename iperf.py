@@ -0,0 +1,415 @@
+"""
+iperf3 client helpers
+Finds the iperf3 binary once, ranks candidate servers with a quick
+concurrent latency pre-probe, and runs clients whose per-second output is
+parsed as it arrives so a test can stop once throughput has settled
+"""
+
+import json
+import os
+import queue
+import re
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Where winget installs iperf3 on the original Windows monitoring host
+WINDOWS_IPERF3_PATH = r"C:\Users\ogcur\AppData\Local\Microsoft\WinGet\Packages\ar51an.iPerf3_Microsoft.Winget.Source_8wekyb3d8bbwe\iperf3.exe"
+
+# Command-line options whose support varies between iperf3 releases
+OPTIONAL_FLAGS = {
+    'json_stream': '--json-stream',  # 3.17+: one JSON object per interval
+    'bidir': '--bidir',              # 3.7+
+    'connect_timeout': '--connect-timeout',
+    'forceflush': '--forceflush',    # Flush interval lines even when stdout is a pipe
+}
+
+# One per-interval report line of the plain-text output, e.g.
+# "[  5]   1.00-2.00   sec  11.2 MBytes  94.1 Mbits/sec    0    245 KBytes"
+INTERVAL_LINE = re.compile(
+    r'^\[\s*(?P<stream>SUM|\d+)\]\s+(?P<start>[\d.]+)-(?P<end>[\d.]+)\s+sec\s+'
+    r'[\d.]+\s+\w?Bytes\s+(?P<rate>[\d.]+)\s+(?P<unit>[KMG]?)bits/sec(?P<rest>.*)$'
+)
+UNIT_MBPS = {'': 1e-6, 'K': 1e-3, 'M': 1.0, 'G': 1e3}
+
+
+class Iperf3Binary:
+    """A resolved iperf3 executable and what it supports"""
+
+    def __init__(self, path, version, features):
+        self.path = path
+        self.version = version
+        self.features = features  # Feature name -> bool, see OPTIONAL_FLAGS
+
+    def supports(self, feature):
+        return self.features.get(feature, False)
+
+    def to_dict(self):
+        return {'path': self.path, 'version': self.version, 'features': self.features}
+
+
+def discover_iperf3(path=None):
+    """Resolve iperf3 (explicit path, $IPERF3_PATH, then PATH) and probe it once
+
+    Returns an Iperf3Binary, or None when no working iperf3 is installed.
+    """
+    candidates = [path, os.environ.get('IPERF3_PATH'), shutil.which('iperf3')]
+    if os.name == 'nt':
+        candidates.append(WINDOWS_IPERF3_PATH)
+
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            result = subprocess.run([candidate, '--version'], capture_output=True, text=True, timeout=5)
+            if result.returncode != 0:
+                continue
+            help_text = subprocess.run([candidate, '--help'], capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"iperf3 candidate {candidate} unusable: {e}")
+            continue
+
+        match = re.search(r'iperf (\d+(?:\.\d+)*)', result.stdout)
+        usage = help_text.stdout + help_text.stderr
+        features = {name: flag in usage for name, flag in OPTIONAL_FLAGS.items()}
+        return Iperf3Binary(candidate, match.group(1) if match else None, features)
+
+    return None
+
+
+def tcp_connect_time(host, port, timeout):
+    """Milliseconds to open a TCP connection (name lookup excluded), or None"""
+    try:
+        family, kind, proto, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        sock = socket.socket(family, kind, proto)
+    except OSError:
+        return None
+    try:
+        sock.settimeout(timeout)
+        start = time.perf_counter()
+        sock.connect(address)
+        return round((time.perf_counter() - start) * 1000, 2)
+    except OSError:
+        return None
+    finally:
+        sock.close()
+
+
+def rank_servers(servers, timeout=2, rtt_sweep=None):
+    """Pre-probe servers concurrently and return the reachable ones, best first
+
+    Every server gets a TCP connect to its iperf port; ``rtt_sweep`` (called
+    as rtt_sweep(hosts, timeout) -> {host: ms}) adds ICMP round-trip times.
+    Servers whose port doesn't accept a connection are dropped. The rest are
+    ordered by ICMP RTT, or by connect time where ICMP got no reply.
+    """
+    if not servers:
+        return []
+
+    with ThreadPoolExecutor(max_workers=len(servers) + 1, thread_name_prefix='server-probe') as executor:
+        rtt_future = None
+        if rtt_sweep is not None:
+            rtt_future = executor.submit(rtt_sweep, list({server['host'] for server in servers}), timeout)
+        connects = [executor.submit(tcp_connect_time, server['host'], server['port'], timeout)
+                    for server in servers]
+
+        rtts = {}
+        if rtt_future is not None:
+            try:
+                rtts = rtt_future.result()
+            except OSError as e:
+                print(f"Server RTT probe error: {e}")
+
+        ranked = []
+        for server, connect in zip(servers, connects):
+            connect_ms = connect.result()
+            if connect_ms is None:
+                continue
+            ranked.append(dict(server, connect_ms=connect_ms, rtt_ms=rtts.get(server['host'])))
+
+    ranked.sort(key=lambda server: server['rtt_ms'] if server['rtt_ms'] is not None else server['connect_ms'])
+    return ranked
+
+
+def parse_interval_line(line):
+    """Parse a plain-text interval line into a dict, or None
+
+    Summary lines (ending in sender/receiver) come back with ``summary`` set
+    to that word. ``retransmits`` is None on the receiving side.
+    """
+    match = INTERVAL_LINE.match(line.strip())
+    if match is None:
+        return None
+    rest = match.group('rest')
+    summary = 'receiver' if 'receiver' in rest else 'sender' if 'sender' in rest else None
+    return {
+        'stream': match.group('stream'),
+        'start': float(match.group('start')),
+        'end': float(match.group('end')),
+        'mbps': float(match.group('rate')) * UNIT_MBPS[match.group('unit')],
+        'retransmits': retransmits_in(rest),
+        'summary': summary
+    }
+
+
+def parse_stream_event(line):
+    """Parse one --json-stream line into (event, data), or None"""
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return None
+    return message.get('event'), message.get('data')
+
+
+class ConvergenceDetector:
+    """Decides when per-second throughput has settled
+
+    Throughput has converged when the last ``window`` intervals (ignoring the
+    first ``skip`` slow-start intervals) all lie within ``tolerance`` of
+    their mean.
+    """
+
+    def __init__(self, window=3, tolerance=0.05, skip=1):
+        self.window = window
+        self.tolerance = tolerance
+        self.skip = skip
+        self.values = []
+
+    def add(self, mbps):
+        """Add one interval; return True once throughput has converged"""
+        self.values.append(mbps)
+        recent = self.values[self.skip:][-self.window:]
+        if len(recent) < self.window:
+            return False
+        mean = sum(recent) / len(recent)
+        return mean > 0 and max(abs(value - mean) for value in recent) <= self.tolerance * mean
+
+    def estimate(self):
+        """Mean of the most recent window"""
+        return window_mean(self.values, self.window, self.skip)
+
+
+def retransmits_in(rest):
+    """Retransmit count from the text after the rate column (sender side only)"""
+    fields = rest.split()
+    return int(fields[0]) if fields and fields[0].isdigit() else None
+
+
+def window_mean(values, window, skip=1):
+    """Mean of the last ``window`` values after skipping slow start"""
+    recent = values[skip:][-window:] or values
+    return round(sum(recent) / len(recent), 2) if recent else 0.0
+
+
+def run_client(binary, host, port, reverse=False, duration=10, on_interval=None,
+               tolerance=0.05, window=3, timeout_margin=20, streams=1, connect_timeout=5):
+    """Run one iperf3 client, reading interval reports as they arrive
+
+    ``on_interval(interval)`` is called for every one-second report of the
+    total. The process is stopped early once the total converges
+    (``tolerance`` of 0 disables that). ``streams`` > 1 runs parallel TCP
+    streams (-P). The process is killed ``timeout_margin`` seconds after the
+    test should have ended, whether or not it is still printing. Returns {'mbps', 'intervals', 'duration', 'converged',
+    'streams', 'per_stream_mbps', 'retransmits'}, or None when the test
+    produced no intervals.
+    """
+    json_stream = binary.supports('json_stream')
+    cmd = [binary.path, '-c', host, '-p', str(port), '-t', str(duration), '-i', '1', '-f', 'm']
+    if streams > 1:
+        cmd += ['-P', str(streams)]
+    if json_stream:
+        cmd.append('--json-stream')
+    elif binary.supports('forceflush'):
+        cmd.append('--forceflush')
+    if binary.supports('connect_timeout'):
+        cmd += ['--connect-timeout', str(int(connect_timeout * 1000))]
+    if reverse:
+        cmd.append('-R')  # Server sends, i.e. download
+
+    detector = ConvergenceDetector(window, tolerance)
+    intervals = []
+    per_stream = {}  # Stream id -> per-second Mbps
+    interval_retransmits = None
+    final_mbps = None
+    final_retransmits = None
+    converged = False
+    started = time.perf_counter()
+    deadline = started + duration + timeout_margin
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+    
+    # Lines are read on a thread so the deadline holds even when iperf3 goes quiet
+    lines = queue.Queue()
+
+    def read_lines():
+        try:
+            for line in process.stdout:
+                lines.put(line)
+        except (OSError, ValueError):
+            pass  # Pipe closed when the process was stopped
+        lines.put(None)
+
+    threading.Thread(target=read_lines, daemon=True, name='iperf3-reader').start()
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                print(f"iperf3 {host}:{port} still running at its deadline, killing it")
+                process.kill()
+                break
+            if line is None:
+                break
+            retransmits = None
+            if json_stream:
+                parsed = parse_stream_event(line)
+                if parsed is None:
+                    continue
+                event, data = parsed
+                if event == 'interval':
+                    for stream in data.get('streams', []):
+                        per_stream.setdefault(stream['socket'], []).append(round(stream['bits_per_second'] / 1e6, 2))
+                    total = data['sum']
+                    retransmits = total.get('retransmits')
+                    interval = {'start': total['start'], 'end': total['end'],
+                                'mbps': total['bits_per_second'] / 1e6}
+                elif event == 'end':
+                    total = data.get('sum_received') or data.get('sum_sent') or data.get('sum')
+                    if total:
+                        final_mbps = total['bits_per_second'] / 1e6
+                    final_retransmits = (data.get('sum_sent') or {}).get('retransmits')
+                    continue
+                elif event == 'error':
+                    print(f"iperf3 {host}:{port} error: {data}")
+                    continue
+                else:
+                    continue
+            else:
+                interval = parse_interval_line(line)
+                if interval is None:
+                    continue
+                # With parallel streams only the [SUM] lines are totals
+                is_total = streams == 1 or interval['stream'] == 'SUM'
+                if interval['summary']:
+                    if is_total and interval['summary'] == 'receiver':
+                        final_mbps = interval['mbps']
+                    elif is_total and interval['summary'] == 'sender':
+                        final_retransmits = interval['retransmits']
+                    continue
+                if interval['stream'] != 'SUM':
+                    per_stream.setdefault(interval['stream'], []).append(round(interval['mbps'], 2))
+                if not is_total:
+                    continue
+                retransmits = interval['retransmits']
+                interval = {key: interval[key] for key in ('start', 'end', 'mbps')}
+
+            if retransmits is not None:
+                interval['retransmits'] = retransmits
+                interval_retransmits = (interval_retransmits or 0) + retransmits
+            interval['mbps'] = round(interval['mbps'], 2)
+            intervals.append(interval)
+            if on_interval is not None:
+                on_interval(interval)
+
+            if tolerance and detector.add(interval['mbps']):
+                converged = True
+                break
+            if time.perf_counter() > deadline:
+                break
+    finally:
+        if process.poll() is None:
+            process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    if not intervals and final_mbps is None:
+        return None
+    if converged:
+        final_mbps = detector.estimate()
+    elif final_mbps is None:
+        # Stopped at the deadline (or convergence off) before the end summary
+        final_mbps = window_mean([interval['mbps'] for interval in intervals], window)
+    return {
+        'mbps': round(final_mbps, 2),
+        'intervals': intervals,
+        'duration': round(time.perf_counter() - started, 2),
+        'converged': converged,
+        'streams': streams,
+        'per_stream_mbps': [window_mean(values, window) for values in per_stream.values()],
+        'retransmits': final_retransmits if final_retransmits is not None else interval_retransmits
+    }
+
+
+def run_aggregate(binary, servers, reverse=False, streams=1, on_interval=None, **options):
+    """Run clients against several servers at once and add up their throughput
+
+    ``on_interval(host, interval)`` gets every server's per-second totals.
+    Other keyword arguments go to run_client. Returns the aggregate with a
+    'servers' breakdown, or None when no server produced a result.
+    """
+    if not servers:
+        return None
+
+    def run_one(server):
+        callback = None
+        if on_interval is not None:
+            callback = lambda interval: on_interval(server['host'], interval)
+        try:
+            return run_client(binary, server['host'], server['port'], reverse,
+                              on_interval=callback, streams=streams, **options)
+        except OSError as e:
+            print(f"iperf3 {server['host']}:{server['port']} failed: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(servers), thread_name_prefix='iperf3') as executor:
+        results = list(zip(servers, executor.map(run_one, servers)))
+
+    finished = [(server, result) for server, result in results if result is not None]
+    if not finished:
+        return None
+    retransmits = [result['retransmits'] for _, result in finished if result['retransmits'] is not None]
+    return {
+        'mbps': round(sum(result['mbps'] for _, result in finished), 2),
+        'streams': streams,
+        'duration': max(result['duration'] for _, result in finished),
+        'retransmits': sum(retransmits) if retransmits else None,
+        'per_stream_mbps': [mbps for _, result in finished for mbps in result['per_stream_mbps']],
+        'servers': [
+            {
+                'host': server['host'],
+                'port': server['port'],
+                'mbps': result['mbps'],
+                'retransmits': result['retransmits'],
+                'converged': result['converged']
+            }
+            for server, result in finished
+        ]
+    }
+
+
+def find_saturation(binary, servers, reverse=False, ladder=(1, 2, 4, 8), min_gain=0.1, **options):
+    """Step up the parallel stream count until throughput stops improving
+
+    Each step runs run_aggregate with the next stream count from ``ladder``;
+    the search stops when a step gains less than ``min_gain`` over the best
+    so far. Returns (best aggregate, [every step's aggregate]).
+    """
+    best = None
+    steps = []
+    for streams in ladder:
+        result = run_aggregate(binary, servers, reverse, streams, **options)
+        if result is None:
+            break
+        steps.append(result)
+        if best is not None and result['mbps'] < best['mbps'] * (1 + min_gain):
+            if result['mbps'] > best['mbps']:
+                best = result
+            break
+        best = result
+    return best, steps
@@ -0,0 +1,389 @@
+"""
+Packet-train bandwidth estimator
+A few dozen back-to-back UDP packets spread out to the bottleneck's pace;
+the receiver's first-to-last arrival gap (the train's dispersion) gives
+the rate at a tiny fraction of a full speed test's traffic. A small
+TrainServer on one of our endpoints sinks upload trains and sends download
+trains on request. A download request must first echo a cookie the server
+sent to its address, so a spoofed source address gets nothing but one
+packet no larger than the request.
+
+Run a server with: python packet_train.py server [--port 5302]
+Measure with:      python packet_train.py client HOST [--port 5302]
+"""
+
+import argparse
+import hashlib
+import hmac
+import itertools
+import os
+import random
+import socket
+import statistics
+import struct
+import threading
+import time
+from collections import deque
+
+DEFAULT_PORT = 5302
+MAGIC = b'SSPT'
+VERSION = 2
+PROBE = 0  # Train packet
+END = 1  # Sent after a train; the receiver answers an upload END with a REPORT
+REPORT = 2  # Server's view of an upload train
+REQUEST = 3  # Client asks for a download train (count in ``count``, size in ``seq``), echoing its cookie
+COOKIE = 4  # Server's answer to a request without a valid cookie
+HEADER = struct.Struct('!4sBBHHH')  # magic, version, kind, train id, seq, count
+REPORT_BODY = struct.Struct('!HHHd')  # received, first seq, last seq, dispersion seconds
+COOKIE_BODY = struct.Struct('!8s')  # Keyed hash of the client address and time window
+DEFAULT_COUNT = 32
+DEFAULT_SIZE = 1200  # UDP payload bytes; stays under the MTU on tunnels too
+MAX_COUNT = 128
+MAX_SIZE = 1472
+UDP_IP_OVERHEAD = 28  # IPv4 + UDP headers, counted in the wire rate
+REQUEST_INTERVAL = 0.5  # Minimum seconds between download trains to one client
+COOKIE_LIFETIME = 30  # Seconds per cookie window; the previous window's cookie is still accepted
+MAX_SEND_RATE = 1_000_000  # Bytes per second of download trains the server sends to all clients
+
+_train_ids = itertools.count(random.randrange(0x10000))
+
+
+def next_train_id():
+    return next(_train_ids) & 0xFFFF
+
+
+def dispersion_rate(first_seq, last_seq, dispersion, size):
+    """Wire rate in Mbps implied by packets first_seq..last_seq arriving ``dispersion`` seconds apart"""
+    if last_seq <= first_seq or dispersion <= 0:
+        return None
+    return (last_seq - first_seq) * (size + UDP_IP_OVERHEAD) * 8 / dispersion / 1e6
+
+
+class TrainReceiver:
+    """Arrival bookkeeping for one train"""
+
+    def __init__(self):
+        self.received = 0
+        self.first_seq = None
+        self.last_seq = None
+        self.first = None
+        self.last = None
+        self.size = 0
+
+    def add(self, seq, size, now):
+        if self.first is None:
+            self.first_seq, self.first = seq, now
+        self.last_seq, self.last = seq, now
+        self.received += 1
+        self.size = size
+
+    @property
+    def dispersion(self):
+        return self.last - self.first if self.first is not None else 0.0
+
+
+def padded(packet, size):
+    """Pad a control packet so the server's answer is never larger than it"""
+    return packet.ljust(size, b'\x00')
+
+
+def send_train(sock, address, train_id, count, size):
+    """Send ``count`` packets of ``size`` bytes back to back, then an END"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    for seq in range(count):
+        HEADER.pack_into(buffer, 0, MAGIC, VERSION, PROBE, train_id, seq, count)
+        if address is None:
+            sock.send(view)
+        else:
+            sock.sendto(view, address)
+    end = padded(HEADER.pack(MAGIC, VERSION, END, train_id, count, count), HEADER.size + REPORT_BODY.size)
+    if address is None:
+        sock.send(end)
+    else:
+        sock.sendto(end, address)
+
+
+class TrainServer:
+    """Sinks upload trains and sends download trains on a daemon thread"""
+
+    def __init__(self, host='0.0.0.0', port=DEFAULT_PORT, max_send_rate=MAX_SEND_RATE):
+        self.host = host
+        self.port = port
+        self.sock = None
+        self.thread = None
+        self.running = False
+        self.trains = {}  # (client address, train id) -> TrainReceiver
+        self.last_request = {}  # Client address -> time of its last download train
+        self.secret = os.urandom(16)
+        self.max_send_rate = max_send_rate
+        self.send_allowance = MAX_COUNT * MAX_SIZE  # Token bucket, one maximal train deep
+        self.send_checked = time.perf_counter()
+
+    def cookie(self, address, window):
+        message = f'{address[0]}:{address[1]}:{window}'.encode()
+        return hmac.new(self.secret, message, hashlib.sha256).digest()[:COOKIE_BODY.size]
+
+    def valid_cookie(self, address, cookie):
+        window = int(time.time() // COOKIE_LIFETIME)
+        return any(hmac.compare_digest(cookie, self.cookie(address, w)) for w in (window, window - 1))
+
+    def allow_send(self, size, now):
+        """Take ``size`` bytes from the global send budget; False when it can't cover them"""
+        self.send_allowance = min(MAX_COUNT * MAX_SIZE,
+                                  self.send_allowance + (now - self.send_checked) * self.max_send_rate)
+        self.send_checked = now
+        if size > self.send_allowance:
+            return False
+        self.send_allowance -= size
+        return True
+
+    @property
+    def address(self):
+        return self.sock.getsockname()
+
+    def start(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((self.host, self.port))
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True, name='train-server')
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
+
+    def _serve(self):
+        buffer = bytearray(65535)
+        while self.running:
+            try:
+                length, address = self.sock.recvfrom_into(buffer)
+            except OSError:
+                break
+            now = time.perf_counter()
+            if length < HEADER.size:
+                continue
+            magic, version, kind, train_id, seq, count = HEADER.unpack_from(buffer)
+            if magic != MAGIC or version != VERSION:
+                continue
+            try:
+                self._handle(kind, address, train_id, seq, count, length, now, buffer)
+            except OSError as e:
+                print(f"Train server error for {address[0]}: {e}")
+
+    def _handle(self, kind, address, train_id, seq, count, length, now, buffer):
+        if kind == PROBE:
+            if len(self.trains) > 256:
+                self.trains.clear()  # Ends lost or never sent
+            self.trains.setdefault((address, train_id), TrainReceiver()).add(seq, length, now)
+        elif kind == END:
+            # Answered only when padded to the report's size, so it can't amplify
+            if length < HEADER.size + REPORT_BODY.size:
+                return
+            train = self.trains.pop((address, train_id), None) or TrainReceiver()
+            report = REPORT_BODY.pack(train.received, train.first_seq or 0, train.last_seq or 0, train.dispersion)
+            self.sock.sendto(HEADER.pack(MAGIC, VERSION, REPORT, train_id, 0, count) + report, address)
+        elif kind == REQUEST:
+            if length < HEADER.size + COOKIE_BODY.size:
+                return
+            # Without a valid cookie the answer is a cookie the size of the request, so a
+            # spoofed source never gets a train
+            cookie, = COOKIE_BODY.unpack_from(buffer, HEADER.size)
+            if not self.valid_cookie(address, cookie):
+                token = self.cookie(address, int(time.time() // COOKIE_LIFETIME))
+                self.sock.sendto(HEADER.pack(MAGIC, VERSION, COOKIE, train_id, 0, 0) + token, address)
+                return
+            # Bounded and rate-limited per client and overall so the server can't be used to flood someone
+            if now - self.last_request.get(address[0], 0) < REQUEST_INTERVAL:
+                return
+            if len(self.last_request) > 1024:
+                self.last_request = {client: last for client, last in self.last_request.items()
+                                     if now - last < REQUEST_INTERVAL}
+            count = min(count, MAX_COUNT)
+            size = max(HEADER.size, min(seq, MAX_SIZE))
+            if not self.allow_send(count * size, now):
+                return
+            self.last_request[address[0]] = now
+            send_train(self.sock, address, train_id, count, size)
+
+
+def run_train(host, port=DEFAULT_PORT, direction='download', count=DEFAULT_COUNT, size=DEFAULT_SIZE, timeout=1.0):
+    """Send (upload) or request (download) one packet train and estimate the rate
+
+    Returns {'direction', 'mbps', 'count', 'received', 'loss_percent',
+    'dispersion_ms', 'bytes'}, or None when no useful train came through.
+    """
+    count = min(count, MAX_COUNT)
+    size = max(HEADER.size, min(size, MAX_SIZE))
+    train_id = next_train_id()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect((host, port))
+        deadline = time.perf_counter() + timeout
+        buffer = bytearray(65535)
+
+        if direction == 'upload':
+            send_train(sock, None, train_id, count, size)
+            train = None
+            # Re-send the END if the report doesn't come back
+            for attempt in range(3):
+                if attempt:
+                    sock.send(padded(HEADER.pack(MAGIC, VERSION, END, train_id, count, count),
+                                     HEADER.size + REPORT_BODY.size))
+                sock.settimeout(max(0.001, min(timeout / 3, deadline - time.perf_counter())))
+                try:
+                    while train is None:
+                        length = sock.recv_into(buffer)
+                        if length < HEADER.size + REPORT_BODY.size:
+                            continue
+                        magic, _, kind, reply_id, _, _ = HEADER.unpack_from(buffer)
+                        if magic == MAGIC and kind == REPORT and reply_id == train_id:
+                            train = TrainReceiver()
+                            train.received, train.first_seq, train.last_seq, dispersion = \
+                                REPORT_BODY.unpack_from(buffer, HEADER.size)
+                            train.first, train.last = 0.0, dispersion
+                except socket.timeout:
+                    pass
+                if train is not None or time.perf_counter() >= deadline:
+                    break
+        else:
+            # First request gets a cookie back; the train comes for the request echoing it
+            request = HEADER.pack(MAGIC, VERSION, REQUEST, train_id, size, count)
+            sock.send(padded(request, HEADER.size + COOKIE_BODY.size))
+            cookie = None
+            while cookie is None and time.perf_counter() < deadline:
+                sock.settimeout(max(0.001, deadline - time.perf_counter()))
+                try:
+                    length = sock.recv_into(buffer)
+                except socket.timeout:
+                    break
+                if length < HEADER.size + COOKIE_BODY.size:
+                    continue
+                magic, _, kind, reply_id, _, _ = HEADER.unpack_from(buffer)
+                if magic == MAGIC and kind == COOKIE and reply_id == train_id:
+                    cookie = bytes(buffer[HEADER.size:HEADER.size + COOKIE_BODY.size])
+            if cookie is None:
+                return None
+            sock.send(request + cookie)
+            train = TrainReceiver()
+            while time.perf_counter() < deadline:
+                sock.settimeout(deadline - time.perf_counter())
+                try:
+                    length = sock.recv_into(buffer)
+                except socket.timeout:
+                    break
+                now = time.perf_counter()
+                if length < HEADER.size:
+                    continue
+                magic, _, kind, reply_id, seq, _ = HEADER.unpack_from(buffer)
+                if magic != MAGIC or reply_id != train_id:
+                    continue
+                if kind == END:
+                    break
+                if kind == PROBE:
+                    train.add(seq, length, now)
+    except OSError as e:
+        print(f"Packet train {direction} to {host}:{port} error: {e}")
+        return None
+    finally:
+        sock.close()
+
+    if train is None or train.received < 2:
+        return None
+    mbps = dispersion_rate(train.first_seq, train.last_seq, train.dispersion, size)
+    if mbps is None:
+        return None
+    return {
+        'direction': direction,
+        'mbps': round(mbps, 2),
+        'count': count,
+        'received': train.received,
+        'loss_percent': round((count - train.received) / count * 100, 1),
+        'dispersion_ms': round(train.dispersion * 1000, 3),
+        'bytes': count * size
+    }
+
+
+class BandwidthTracker:
+    """Recent train estimates per direction, scaled by the last full speed test
+
+    Train dispersion tracks changes in available bandwidth well but its
+    absolute level is biased (cross traffic, receive timing), so each
+    full speed test sets a per-direction calibration factor.
+    """
+
+    def __init__(self, window=5):
+        self.window = window
+        self.samples = {'download': deque(maxlen=window), 'upload': deque(maxlen=window)}
+        self.last = {}
+        self.calibration = {'download': 1.0, 'upload': 1.0}
+        self.calibrated_at = {}
+        self.lock = threading.Lock()
+
+    def add(self, result):
+        with self.lock:
+            self.samples[result['direction']].append(result['mbps'])
+            self.last[result['direction']] = result
+
+    def calibrate(self, direction, measured_mbps):
+        """Scale future estimates so the current one matches a full test"""
+        with self.lock:
+            samples = self.samples[direction]
+            if not samples or not measured_mbps:
+                return False
+            self.calibration[direction] = measured_mbps / statistics.median(samples)
+            self.calibrated_at[direction] = time.time()
+            return True
+
+    def estimate(self):
+        """Median of the recent trains per direction, raw and calibrated"""
+        with self.lock:
+            estimate = {}
+            for direction, samples in self.samples.items():
+                if not samples:
+                    continue
+                raw = statistics.median(samples)
+                last = self.last[direction]
+                estimate[direction] = {
+                    'mbps': round(raw * self.calibration[direction], 2),
+                    'raw_mbps': round(raw, 2),
+                    'last_mbps': last['mbps'],
+                    'loss_percent': last['loss_percent'],
+                    'calibration': round(self.calibration[direction], 3),
+                    'calibrated_at': self.calibrated_at.get(direction),
+                    'samples': len(samples)
+                }
+            return estimate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packet-train bandwidth estimator")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    server_parser = subparsers.add_parser('server', help="Answer packet trains")
+    server_parser.add_argument('--host', default='0.0.0.0')
+    server_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    client_parser = subparsers.add_parser('client', help="Estimate the rate to a server")
+    client_parser.add_argument('host')
+    client_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    client_parser.add_argument('--count', type=int, default=DEFAULT_COUNT)
+    client_parser.add_argument('--size', type=int, default=DEFAULT_SIZE)
+    args = parser.parse_args()
+
+    if args.mode == 'server':
+        server = TrainServer(args.host, args.port).start()
+        print(f"Packet train server listening on {server.address[0]}:{server.address[1]}")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        for direction in ('download', 'upload'):
+            result = run_train(args.host, args.port, direction, args.count, args.size)
+            print(f"{direction.capitalize()}: " + (f"{result['mbps']:.2f} Mbps ({result['received']}/{result['count']} packets, "
+                                                   f"{result['dispersion_ms']} ms)" if result else "no estimate"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Persistent streaming ping workers
+Keeps one long-running ping process per target and parses replies as
+they arrive instead of forking a new ping for every sample. Monitor ticks
+pull the newest reply with latest()
+"""
+
+import atexit
+import os
+import re
+import subprocess
+import threading
+import time
+
+# Matches "time=12.3 ms" (Linux/Mac) and "time=12ms" / "time<1ms" (Windows)
+REPLY_PATTERN = re.compile(r'time[=<]\s*([\d.]+)\s*ms')
+
+RESTART_BACKOFF = 5  # Seconds before restarting a worker that died
+
+
+def build_ping_command(host, interval):
+    """Build the command line for a continuous ping"""
+    if os.name == 'nt':  # Windows pings once a second until stopped
+        return ['ping', '-t', host]
+    return ['ping', '-n', '-i', str(interval), host]
+
+
+def parse_reply(line):
+    """Extract the RTT in ms from one line of ping output"""
+    match = REPLY_PATTERN.search(line)
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class PingWorker:
+    """One continuous ping process feeding samples for a single target"""
+
+    def __init__(self, host, interval):
+        self.host = host
+        self.interval = interval
+        self.process = None
+        self.reader = None
+        self.last_rtt = None
+        self.last_reply = 0
+        self.started_at = 0
+        self.restarts = 0
+
+    def start(self):
+        """Start the ping process and its output reader"""
+        self.process = subprocess.Popen(
+            build_ping_command(self.host, self.interval),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            stdin=subprocess.DEVNULL,
+            text=True,
+            bufsize=1
+        )
+        self.started_at = time.time()
+        self.reader = threading.Thread(target=self._read_output, daemon=True,
+                                       name=f'ping-{self.host}')
+        self.reader.start()
+
+    def _read_output(self):
+        """Parse ping output line by line as it arrives"""
+        process = self.process
+        for line in process.stdout:
+            rtt = parse_reply(line)
+            if rtt is None:
+                continue
+            self.last_rtt = rtt
+            self.last_reply = time.time()
+        process.stdout.close()
+
+    def alive(self):
+        """Check whether the ping process is still running"""
+        return self.process is not None and self.process.poll() is None
+
+    def latest(self, max_age):
+        """Return the newest RTT, or None when no reply arrived within max_age"""
+        if time.time() - self.last_reply > max_age:
+            return None
+        return self.last_rtt
+
+    def stop(self):
+        """Terminate the ping process"""
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+class PingWorkerPool:
+    """Set of streaming ping workers, restarted when they die"""
+
+    def __init__(self, interval=1):
+        self.interval = interval
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.stopped = False
+        atexit.register(self.stop_all)
+
+    def ensure(self, host):
+        """Get the worker for a host, starting or restarting it as needed"""
+        with self.lock:
+            if self.stopped:
+                return None
+            worker = self.workers.get(host)
+            if worker is None:
+                worker = PingWorker(host, self.interval)
+                self.workers[host] = worker
+                self._start(worker)
+            elif not worker.alive() and time.time() - worker.started_at > RESTART_BACKOFF:
+                print(f"Ping worker for {host} died, restarting")
+                worker.restarts += 1
+                self._start(worker)
+            return worker
+
+    @staticmethod
+    def _start(worker):
+        try:
+            worker.start()
+        except OSError as e:
+            # Keep the worker so the backoff applies before the next attempt
+            worker.started_at = time.time()
+            print(f"Could not start ping worker for {worker.host}: {e}")
+
+    def latest(self, host, max_age=None):
+        """Return the newest RTT for a host, starting its worker if needed"""
+        worker = self.ensure(host)
+        if worker is None:
+            return None
+        return worker.latest(max_age if max_age is not None else self.interval * 3)
+
+    def retain(self, hosts):
+        """Stop the workers for hosts that are no longer probed"""
+        with self.lock:
+            for host in list(self.workers):
+                if host not in hosts:
+                    self.workers.pop(host).stop()
+
+    def stop_all(self):
+        """Stop every worker (called on shutdown)"""
+        with self.lock:
+            self.stopped = True
+            for worker in self.workers.values():
+                worker.stop()
+            self.workers.clear()
+
+    def status(self):
+        """Summarize the workers for the status API"""
+        with self.lock:
+            return {
+                host: {
+                    'alive': worker.alive(),
+                    'last_rtt': worker.last_rtt,
+                    'restarts': worker.restarts
+                }
+                for host, worker in self.workers.items()
+            }
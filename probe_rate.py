@@ -0,0 +1,149 @@
+"""
+Adaptive probe rate
+Monitor ticks speed up (down to sub-second) when latency jumps, echoes go
+missing or interfaces change, and back off while the link stays calm.
+A packets-per-second budget per target caps how often each host is pinged.
+"""
+
+import threading
+import time
+
+
+class TargetTracker:
+    """Smoothed RTT and mean deviation of one target (RFC 6298 style)"""
+
+    __slots__ = ('srtt', 'rttvar', 'last_rtt', 'lost', 'last_probe')
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.last_rtt = None
+        self.lost = False
+        self.last_probe = None
+
+
+class ProbeRateController:
+    """Chooses the monitor tick interval from recent probe results
+
+    A sample further from its target's smoothed RTT than
+    ``deviation_factor`` mean deviations (and at least ``min_jump_ms``), a
+    target that stops answering, or an interface change drops the interval
+    to ``min_interval``. Once ``hold`` seconds pass without such an event
+    each tick stretches the interval by ``backoff`` up to ``max_interval``.
+    """
+
+    def __init__(self, initial_interval=5, min_interval=0.5, max_interval=10, hold=30, backoff=1.5,
+                 deviation_factor=4, min_jump_ms=10, default_pps=2.0, target_pps=None):
+        self.interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hold = hold
+        self.backoff = backoff
+        self.deviation_factor = deviation_factor
+        self.min_jump_ms = min_jump_ms
+        self.default_pps = default_pps
+        self.target_pps = dict(target_pps or {})  # Host -> echoes per second it may get
+        self.targets = {}
+        self.calm_since = time.time()
+        self.last_event = None
+        self.events = 0
+        self.lock = threading.Lock()
+
+    def budget(self, host):
+        return self.target_pps.get(host, self.default_pps)
+
+    def due_targets(self, targets, now):
+        """The targets (name -> host) whose packet budget allows a probe now
+
+        The budget is only spent when observe() gets a result for the host,
+        so a target the prober had no room for stays due.
+        """
+        with self.lock:
+            due_hosts = set()
+            for host in set(targets.values()):
+                tracker = self.targets.setdefault(host, TargetTracker())
+                pps = self.budget(host)
+                # 10% slack so tick jitter doesn't push a probe a whole tick later
+                if pps > 0 and (tracker.last_probe is None or now - tracker.last_probe >= 0.9 / pps):
+                    due_hosts.add(host)
+            return {name: host for name, host in targets.items() if host in due_hosts}
+
+    def retain(self, hosts):
+        """Forget targets that are no longer probed"""
+        with self.lock:
+            for host in set(self.targets) - set(hosts):
+                del self.targets[host]
+
+    def latest(self, host):
+        """Last measured RTT of a host for display on ticks its budget skipped, None once lost"""
+        tracker = self.targets.get(host)
+        return tracker.last_rtt if tracker is not None and not tracker.lost else None
+
+    def observe(self, rtts, now, probed_at=None):
+        """Feed one tick's RTTs (host -> ms, None when lost); return the next interval
+
+        Every host in ``rtts`` had an echo out, so its budget is spent as of
+        ``probed_at`` (the time the tick sent its probes, default ``now``).
+        """
+        with self.lock:
+            reason = None
+            for host, rtt in rtts.items():
+                tracker = self.targets.setdefault(host, TargetTracker())
+                tracker.last_probe = probed_at if probed_at is not None else now
+                if rtt is None:
+                    # Only the change counts, so a dead target doesn't pin the rate
+                    if not tracker.lost and tracker.last_rtt is not None:
+                        reason = reason or f'loss from {host}'
+                    tracker.lost = True
+                    tracker.last_rtt = None
+                    continue
+
+                tracker.lost = False
+                tracker.last_rtt = rtt
+                if tracker.srtt is None:
+                    tracker.srtt, tracker.rttvar = rtt, rtt / 2
+                    continue
+                deviation = abs(rtt - tracker.srtt)
+                if deviation > max(self.min_jump_ms, self.deviation_factor * tracker.rttvar):
+                    reason = reason or f'latency jump to {host}'
+                tracker.rttvar = 0.75 * tracker.rttvar + 0.25 * deviation
+                tracker.srtt = 0.875 * tracker.srtt + 0.125 * rtt
+
+            if reason is not None:
+                self._speed_up(reason, now)
+            elif now - self.calm_since >= self.hold:
+                self.interval = min(self.max_interval, self.interval * self.backoff)
+            return self.interval
+
+    def event(self, reason, now=None):
+        """Speed up right away (e.g. on an interface change); return the new interval"""
+        with self.lock:
+            self._speed_up(reason, now if now is not None else time.time())
+            return self.interval
+
+    def _speed_up(self, reason, now):
+        self.interval = self.min_interval
+        self.calm_since = now
+        self.last_event = {'reason': reason, 'time': now}
+        self.events += 1
+
+    def status(self):
+        """Current rate, the last event and per-target budgets for /api/status"""
+        with self.lock:
+            return {
+                'interval': round(self.interval, 3),
+                'rate_hz': round(1 / self.interval, 2),
+                'min_interval': self.min_interval,
+                'max_interval': self.max_interval,
+                'last_event': self.last_event,
+                'events': self.events,
+                'targets': {
+                    host: {
+                        'pps_budget': self.budget(host),
+                        'srtt_ms': round(tracker.srtt, 2) if tracker.srtt is not None else None,
+                        'rttvar_ms': round(tracker.rttvar, 2) if tracker.rttvar is not None else None,
+                        'lost': tracker.lost
+                    }
+                    for host, tracker in self.targets.items()
+                }
+            }
@@ -0,0 +1,93 @@
+"""
+Server-Sent Events broadcaster
+Each event is encoded once and fanned out to every subscriber through a
+bounded queue; subscribers that fall behind are disconnected
+"""
+
+import queue
+import threading
+import time
+
+from snapshots import dumps
+
+KEEPALIVE_INTERVAL = 15  # Seconds between comment lines on an idle stream
+
+
+def encode_event(event, data, event_id=None):
+    """Encode one SSE message (data may already be encoded JSON bytes)"""
+    header = f'event: {event}\n'
+    if event_id is not None:
+        header += f'id: {event_id}\n'
+    body = data if isinstance(data, bytes) else dumps(data)
+    return header.encode() + b'data: ' + body + b'\n\n'
+
+
+class Subscriber:
+    """One connected client and its pending messages"""
+
+    def __init__(self, max_queue):
+        self.messages = queue.Queue(maxsize=max_queue)
+        self.closed = False
+        self.connected_at = time.time()
+
+
+class Broadcaster:
+    """Fan-out of pre-encoded events to all subscribers"""
+
+    def __init__(self, max_queue=32, max_subscribers=200):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def has_subscribers(self):
+        return bool(self.subscribers)
+
+    def subscribe(self):
+        """Register a new subscriber, or return None when the limit is reached"""
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(self.max_queue)
+            self.subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+        subscriber.closed = True
+
+    def publish(self, event, data, event_id=None):
+        """Encode an event once and queue it for every subscriber"""
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+        message = encode_event(event, data, event_id)
+        for subscriber in subscribers:
+            try:
+                subscriber.messages.put_nowait(message)
+            except queue.Full:
+                # A client this far behind would see a gap; cut it loose so it
+                # reconnects and starts again from a full snapshot
+                self.unsubscribe(subscriber)
+                self.dropped += 1
+                print("Dropped slow event stream subscriber")
+
+    def stream(self, subscriber, first_message=None):
+        """Yield the messages for one subscriber until it disconnects"""
+        try:
+            if first_message is not None:
+                yield first_message
+            while not subscriber.closed:
+                try:
+                    yield subscriber.messages.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield b': keepalive\n\n'
+        finally:
+            # Runs when the client goes away and the WSGI server closes the generator
+            self.unsubscribe(subscriber)
+
+    def status(self):
+        return {'subscribers': len(self.subscribers), 'dropped': self.dropped}
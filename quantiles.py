@@ -0,0 +1,126 @@
+"""
+Streaming latency percentiles
+Log-bucketed quantile sketch (DDSketch style): O(1) updates, bounded
+memory, mergeable across windows
+"""
+
+import math
+
+PERCENTILES = (('p50', 0.50), ('p90', 0.90), ('p99', 0.99), ('p99_9', 0.999))
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch over positive values
+
+    Values are counted in logarithmic buckets, so any quantile is returned
+    within ``relative_accuracy`` of the true value. Values at or below
+    ``min_value`` share one bucket and values above ``max_value`` are
+    clamped, which caps the number of buckets (and memory) per sketch.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=0.01, max_value=60000.0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.max_index = math.ceil(math.log(max_value) / self.log_gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value):
+        """Count one value"""
+        self.count += 1
+        if value <= self.min_value:
+            self.zero_count += 1
+            return
+        index = min(math.ceil(math.log(value) / self.log_gamma), self.max_index)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        """Add another sketch with the same accuracy into this one"""
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge sketches with different accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def clear(self):
+        self.buckets.clear()
+        self.zero_count = 0
+        self.count = 0
+
+    def quantiles(self, qs):
+        """Estimate several quantiles (ascending, 0 <= q <= 1) in one pass"""
+        if self.count == 0:
+            return [None] * len(qs)
+        results = []
+        indexes = iter(sorted(self.buckets))
+        seen = self.zero_count
+        value = 0.0
+        for q in qs:
+            rank = q * (self.count - 1)
+            while rank >= seen:
+                index = next(indexes, None)
+                if index is None:
+                    break
+                seen += self.buckets[index]
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+            results.append(value)
+        return results
+
+    def quantile(self, q):
+        """Estimate the q-quantile (0 <= q <= 1), or None when empty"""
+        return self.quantiles([q])[0]
+
+    def percentiles(self):
+        """Return p50/p90/p99/p99.9 rounded to 0.01 ms"""
+        values = self.quantiles([q for _, q in PERCENTILES])
+        return {
+            name: None if value is None else round(value, 2)
+            for (name, _), value in zip(PERCENTILES, values)
+        }
+
+
+class WindowedSketch:
+    """Latency sketch per tumbling window plus one over the process lifetime"""
+
+    def __init__(self, window=300, relative_accuracy=0.01):
+        self.window = window
+        self.window_index = None
+        self.current = QuantileSketch(relative_accuracy)
+        self.previous = QuantileSketch(relative_accuracy)
+        self.lifetime = QuantileSketch(relative_accuracy)
+
+    def add(self, timestamp, value):
+        """Count one latency sample (None is ignored)"""
+        window_index = int(timestamp // self.window)
+        if window_index != self.window_index:
+            # Keep the completed window; drop it if a whole window was skipped
+            if self.window_index is not None and window_index - self.window_index == 1:
+                self.previous, self.current = self.current, self.previous
+            else:
+                self.previous.clear()
+            self.current.clear()
+            self.window_index = window_index
+        if value is None:
+            return
+        self.current.add(value)
+        self.lifetime.add(value)
+
+    def summary(self):
+        """Percentiles for the last completed window and the lifetime"""
+        return {
+            'window_seconds': self.window,
+            'window': (self.previous if self.previous.count else self.current).percentiles(),
+            'lifetime': self.lifetime.percentiles(),
+            'samples': self.lifetime.count
+        }
+
+    def reset(self):
+        self.window_index = None
+        self.current.clear()
+        self.previous.clear()
+        self.lifetime.clear()
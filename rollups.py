@@ -0,0 +1,138 @@
+"""
+Incremental multi-resolution rollups
+Samples are folded into 1 s / 1 min / 1 h / 1 day buckets as they arrive
+"""
+
+import math
+from collections import deque
+
+from quantiles import PERCENTILES, QuantileSketch
+
+# (resolution, retention) in seconds; the raw 1 s tier expires first
+TIERS = (
+    (1, 6 * 3600),
+    (60, 14 * 86400),
+    (3600, 366 * 86400),
+    (86400, 5 * 366 * 86400),
+)
+
+
+def row_to_dict(row):
+    """Turn a (start, count, loss, min, max, sum, p50, p90, p99, p99_9) row into a JSON-friendly dict"""
+    start, count, loss, low, high, total = row[:6]
+    received = count - loss
+    result = {
+        'start': start,
+        'count': count,
+        'loss': loss,
+        'min': low if received else None,
+        'max': high if received else None,
+        'mean': round(total / received, 3) if received else None
+    }
+    for (name, _), value in zip(PERCENTILES, row[6:]):
+        result[name] = None if math.isnan(value) else value
+    return result
+
+
+class RollupTier:
+    """Closed buckets of one resolution plus the bucket being filled"""
+
+    def __init__(self, resolution, retention, quantiles=False):
+        self.resolution = resolution
+        self.retention = retention
+        self.rows = deque()
+        self.current = None  # [start, count, loss, min, max, sum]
+        self.sketch = QuantileSketch() if quantiles else None
+
+    def add(self, timestamp, value):
+        """Fold one sample in (None counts as loss); return the bucket it closed, if any"""
+        start = timestamp - timestamp % self.resolution
+        closed = None
+        if self.current is not None and self.current[0] != start:
+            closed = self.close()
+        if self.current is None:
+            self.current = [start, 0, 0, math.inf, -math.inf, 0.0]
+
+        bucket = self.current
+        bucket[1] += 1
+        if value is None:
+            bucket[2] += 1
+        else:
+            if value < bucket[3]:
+                bucket[3] = value
+            if value > bucket[4]:
+                bucket[4] = value
+            bucket[5] += value
+            if self.sketch is not None:
+                self.sketch.add(value)
+        return closed
+
+    def _open_row(self):
+        """Snapshot the open bucket with its percentiles (NaN without a sketch)"""
+        if self.sketch is None:
+            percentiles = (math.nan,) * len(PERCENTILES)
+        else:
+            percentiles = tuple(math.nan if value is None else value
+                                for value in self.sketch.percentiles().values())
+        return tuple(self.current) + percentiles
+
+    def close(self):
+        """Move the open bucket into the closed rows and expire old rows"""
+        row = self._open_row()
+        self.rows.append(row)
+        self.current = None
+        if self.sketch is not None:
+            self.sketch.clear()
+        self.expire(row[0])
+        return row
+
+    def expire(self, now):
+        cutoff = now - self.retention
+        while self.rows and self.rows[0][0] < cutoff:
+            self.rows.popleft()
+
+    def load(self, rows):
+        """Seed the closed rows (oldest first), e.g. from the on-disk store"""
+        self.rows.extend(tuple(row) for row in rows)
+        if self.rows:
+            self.expire(self.rows[-1][0])
+
+    def query(self, start, end, include_open=True):
+        """Rows whose bucket starts in [start, end)"""
+        rows = [row for row in self.rows if start <= row[0] < end]
+        if include_open and self.current is not None and start <= self.current[0] < end:
+            rows.append(self._open_row())
+        return rows
+
+
+class Rollups:
+    """Rollup tiers for several metrics, fed one sample at a time"""
+
+    def __init__(self, metrics, tiers=TIERS, sink=None, quantile_metrics=()):
+        self.tiers = {
+            metric: {
+                resolution: RollupTier(resolution, retention, metric in quantile_metrics)
+                for resolution, retention in tiers
+            }
+            for metric in metrics
+        }
+        self.sink = sink  # Called as sink(metric, resolution, row) for every closed bucket
+
+    def add(self, timestamp, values):
+        """Fold a {metric: value} sample into every tier"""
+        for metric, value in values.items():
+            for resolution, tier in self.tiers[metric].items():
+                closed = tier.add(timestamp, value)
+                if closed is not None and self.sink is not None:
+                    self.sink(metric, resolution, closed)
+
+    def load(self, metric, resolution, rows):
+        """Seed one tier with closed rows"""
+        self.tiers[metric][resolution].load(rows)
+
+    def query(self, metric, resolution, start, end):
+        """Aggregated rows for one metric and resolution as dicts"""
+        tier = self.tiers[metric].get(resolution)
+        if tier is None:
+            raise ValueError(f"No {resolution}s rollup tier")
+        return [row_to_dict(row) for row in tier.query(start, end)]
@@ -0,0 +1,188 @@
+"""
+Deadline-based job scheduler
+Recurring jobs sit in a heap ordered by their next deadline; one thread
+sleeps until the earliest deadline and hands due jobs to a worker pool
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Job:
+    """A recurring job and its run accounting
+
+    Runs are fixed-rate: slot N is ``first slot + N * interval`` no matter
+    how long each run takes. ``align`` places slots on wall-clock multiples
+    of the interval (e.g. every 3 minutes on the minute), and each run is
+    started up to ``jitter`` seconds after its slot.
+    """
+
+    def __init__(self, name, func, interval, jitter=0, align=False, run_now=False):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.align = align
+        self.run_now = run_now
+        self.slot = None  # Start of the current fixed-rate slot
+        self.due = None  # Slot plus this run's jitter
+        self.entry = None  # Heap entry id of the live deadline; older entries are stale
+        self.running = False
+        self.runs = 0
+        self.skipped = 0  # Slots dropped because the previous run was still going
+        self.missed = 0  # Slots that passed while the scheduler could not run them
+        self.errors = 0
+        self.last_error = None
+        self.last_start = None
+        self.last_duration = None
+
+    def first_slot(self, now):
+        if self.run_now:
+            return now
+        if self.align:
+            return now - now % self.interval + self.interval
+        return now + self.interval
+
+    def advance(self, now):
+        """Move to the next slot after ``now`` and count the slots skipped over"""
+        self.slot += self.interval
+        if self.slot <= now - self.interval:
+            # Late by more than a whole interval (suspend, clock jump, long stall):
+            # count the lost slots instead of running them back to back
+            lost = int((now - self.slot) // self.interval)
+            self.missed += lost
+            self.slot += lost * self.interval
+        self.due = self.slot + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def status(self):
+        return {
+            'interval': self.interval,
+            'running': self.running,
+            'next_run': self.due,
+            'last_start': self.last_start,
+            'last_duration': self.last_duration,
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'missed': self.missed,
+            'errors': self.errors,
+            'last_error': self.last_error
+        }
+
+
+class Scheduler:
+    """Runs recurring jobs at their deadlines without polling"""
+
+    def __init__(self, max_workers=8):
+        self.jobs = {}
+        self.heap = []
+        self.counter = itertools.count()  # Tie-breaker for equal deadlines
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.thread = None
+        self.running = False
+
+    def add_job(self, name, func, interval, jitter=0, align=False, run_now=False):
+        """Register a recurring job; its first run is scheduled immediately"""
+        job = Job(name, func, interval, jitter, align, run_now)
+        with self.condition:
+            if name in self.jobs:
+                raise ValueError(f"Job {name} already exists")
+            self.jobs[name] = job
+            now = time.time()
+            job.slot = job.first_slot(now)
+            job.due = job.slot + (random.uniform(0, job.jitter) if job.jitter and not run_now else 0)
+            self._push(job)
+            # Wake the loop in case this job is due before whatever it sleeps on
+            self.condition.notify()
+        return job
+
+    def set_interval(self, name, interval):
+        """Change a job's interval, moving its next run to the new spacing"""
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        with self.condition:
+            job = self.jobs[name]
+            if interval == job.interval:
+                return
+            # The next slot becomes the previous slot plus the new interval
+            job.slot = max(job.slot - job.interval + interval, time.time())
+            job.interval = interval
+            job.due = job.slot + (random.uniform(0, job.jitter) if job.jitter else 0)
+            self._push(job)
+            self.condition.notify()
+
+    def _push(self, job):
+        job.entry = next(self.counter)
+        heapq.heappush(self.heap, (job.due, job.entry, job))
+
+    def start(self):
+        """Start the scheduler thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True, name='scheduler')
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def _run(self):
+        with self.condition:
+            while self.running:
+                if not self.heap:
+                    self.condition.wait()
+                    continue
+                due, entry, job = self.heap[0]
+                if entry != job.entry:
+                    heapq.heappop(self.heap)  # Superseded by set_interval
+                    continue
+                now = time.time()
+                if due > now:
+                    self.condition.wait(due - now)
+                    continue
+
+                heapq.heappop(self.heap)
+                self._dispatch(job, now)
+                job.advance(now)
+                self._push(job)
+
+    def _dispatch(self, job, now):
+        # No-overlap policy: a slot whose previous run is still going is skipped
+        if job.running:
+            job.skipped += 1
+            print(f"Skipping {job.name}: previous run still in progress")
+            return
+        job.running = True
+        job.last_start = now
+        try:
+            self.executor.submit(self._execute, job)
+        except RuntimeError:
+            # Worker pool shut down: the interpreter is exiting
+            job.running = False
+            self.running = False
+
+    def _execute(self, job):
+        started = time.perf_counter()
+        try:
+            job.func()
+        except Exception as e:
+            job.errors += 1
+            job.last_error = str(e)
+            print(f"Job {job.name} error: {e}")
+        finally:
+            job.runs += 1
+            job.last_duration = round(time.perf_counter() - started, 3)
+            job.running = False
+
+    def status(self):
+        """Run accounting for every job"""
+        with self.condition:
+            return {name: job.status() for name, job in self.jobs.items()}
@@ -0,0 +1,68 @@
+"""
+Encode-once status snapshots
+The monitor serializes and compresses each published state once; request
+handlers only pick the right pre-built byte string
+"""
+
+import gzip
+import json
+
+# Optional faster JSON encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional brotli compression
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(obj):
+    """Serialize to compact JSON bytes (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+class EncodedPayload:
+    """Immutable JSON body with pre-compressed variants"""
+
+    def __init__(self, payload):
+        self.body = dumps(payload)
+        self.gzip = gzip.compress(self.body, compresslevel=GZIP_LEVEL)
+        self.brotli = brotli.compress(self.body, quality=BROTLI_QUALITY) if brotli is not None else None
+
+    def select(self, accept_encoding):
+        """Pick (body, content_encoding) for an Accept-Encoding header value"""
+        accepted = {token.split(';')[0].strip() for token in (accept_encoding or '').split(',')}
+        if self.brotli is not None and 'br' in accepted:
+            return self.brotli, 'br'
+        if 'gzip' in accepted:
+            return self.gzip, 'gzip'
+        return self.body, None
+
+
+class StatusSnapshot:
+    """Everything published for one state version"""
+
+    def __init__(self, version, history_cursor, full, delta=None, previous_version=None, previous_cursor=None,
+                 epoch=''):
+        self.version = version
+        self.epoch = epoch  # Versions and cursors restart with the process; the epoch tells runs apart
+        self.etag = f'{epoch}-v{version}'
+        self.history_cursor = history_cursor
+        self.full = EncodedPayload(full)
+        # Delta from the previous version, served to clients that are one step behind
+        self.delta = EncodedPayload(delta) if delta is not None else None
+        self.previous_version = previous_version
+        self.previous_cursor = previous_cursor
+
+    def matches_delta(self, since, cursor, epoch):
+        return (self.delta is not None and epoch == self.epoch
+                and since == self.previous_version and cursor == self.previous_cursor)
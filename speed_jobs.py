@@ -0,0 +1,129 @@
+"""
+Single-flight speed-test jobs
+At most one speed test runs at a time; manual and scheduled requests that
+arrive while it runs attach to it and share its result
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+class SpeedTestJob:
+    """One speed-test run, its progress events and its result"""
+
+    def __init__(self, job_id, trigger, mode):
+        self.id = job_id
+        self.trigger = trigger  # 'manual' or 'scheduled'
+        self.mode = mode
+        self.status = 'running'
+        self.stage = 'starting'
+        self.events = []
+        self.result = None
+        self.error = None
+        self.attached = 0  # Requests that joined this run instead of starting one
+        self.started = time.time()
+        self.finished = None
+        self.condition = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status != 'running'
+
+    def report(self, stage, message=None, **fields):
+        """Record a progress event (passed to the test as its progress callback)"""
+        event = dict(fields, seq=len(self.events), time=time.time(), stage=stage)
+        if message is not None:
+            event['message'] = message
+        with self.condition:
+            self.stage = stage
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.result = result
+            self.error = error
+            self.status = 'error' if error is not None else 'done'
+            self.finished = time.time()
+            self.condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Block until the job is done; return True if it is"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.done, timeout)
+
+    def wait_for_events(self, seen, timeout):
+        """Block until there are events after ``seen`` or the job is done"""
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.events) > seen or self.done, timeout)
+            return self.events[seen:], self.done
+
+    def to_dict(self, since=0):
+        """JSON-friendly job state with the progress events from ``since`` on"""
+        return {
+            'id': self.id,
+            'trigger': self.trigger,
+            'mode': self.mode,
+            'status': self.status,
+            'stage': self.stage,
+            'attached': self.attached,
+            'started': self.started,
+            'finished': self.finished,
+            'progress': self.events[since:],
+            'result': self.result,
+            'error': self.error
+        }
+
+
+class SpeedTestRunner:
+    """Runs speed tests one at a time on a background thread"""
+
+    def __init__(self, modes, on_result=None, keep=20):
+        self.modes = modes  # Mode name -> test function called as run(progress), returning the result
+        self.on_result = on_result  # Called with the result when a run succeeds
+        self.keep = keep  # Finished jobs kept for polling
+        self.jobs = OrderedDict()
+        self.current = None
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def start(self, trigger='manual', mode='standard'):
+        """Start a test, or attach to the one running; return (job, started)
+
+        A request attaches to the running test whatever its mode, since two
+        tests at once would skew each other.
+        """
+        if mode not in self.modes:
+            raise ValueError(f"Unknown speed test mode: {mode}")
+        with self.lock:
+            if self.current is not None and not self.current.done:
+                self.current.attached += 1
+                return self.current, False
+
+            job = SpeedTestJob(f'{int(time.time())}-{next(self.counter)}', trigger, mode)
+            self.current = job
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep:
+                self.jobs.popitem(last=False)
+
+        threading.Thread(target=self._execute, args=(job,), daemon=True, name='speed-test').start()
+        return job, True
+
+    def _execute(self, job):
+        try:
+            result = self.modes[job.mode](job.report)
+        except Exception as e:
+            print(f"Speed test job {job.id} error: {e}")
+            job.finish(error=str(e))
+            return
+        try:
+            if self.on_result is not None:
+                self.on_result(result)
+        except Exception as e:
+            print(f"Speed test result handler error: {e}")
+        job.finish(result)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
@@ -0,0 +1,75 @@
+"""
+Copy-on-write monitoring state
+Writers build a new immutable version and swap one reference; readers take
+the current reference without locking and never see a half-applied update
+"""
+
+import threading
+from types import MappingProxyType
+
+
+class State:
+    """One published version of the monitoring state
+
+    Field values are shared between versions and must never be modified in
+    place; writers replace a field with a new dict or list instead.
+    """
+
+    __slots__ = ('data', 'version', 'field_versions')
+
+    def __init__(self, data, version, field_versions):
+        self.data = MappingProxyType(data)
+        self.version = version
+        self.field_versions = MappingProxyType(field_versions)  # Field -> version it last changed in
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def changed_since(self, version):
+        """Fields whose value changed after a version"""
+        return {
+            key: self.data[key] for key, changed_at in self.field_versions.items()
+            if changed_at > version
+        }
+
+
+class StateStore:
+    """Holder of the current State
+
+    Writers are serialized by a lock so read-modify-write updates (counters,
+    per-interface dicts) don't lose each other's changes. Readers only load
+    ``current``, which is a single reference assignment.
+    """
+
+    def __init__(self, initial):
+        self.current = State(dict(initial), 0, dict.fromkeys(initial, 0))
+        self.write_lock = threading.Lock()
+
+    def update(self, changes):
+        """Publish a new version with some fields replaced
+
+        ``changes`` is a dict of new field values, or a function called with
+        the current (read-only) data under the write lock that returns one.
+        Fields whose new value equals the old one don't bump the version.
+        """
+        with self.write_lock:
+            current = self.current
+            if callable(changes):
+                changes = changes(current.data)
+            changed = {
+                key: value for key, value in changes.items()
+                if key not in current.data or not (current.data[key] is value or current.data[key] == value)
+            }
+            if not changed:
+                return current
+
+            version = current.version + 1
+            data = dict(current.data)
+            data.update(changed)
+            field_versions = dict(current.field_versions)
+            field_versions.update(dict.fromkeys(changed, version))
+            self.current = State(data, version, field_versions)
+            return self.current
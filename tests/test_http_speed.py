@@ -0,0 +1,78 @@
+"""
+Loopback tests for the streaming HTTP throughput test and the upload sink
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_speed
+from http_speed import SinkServer, run_download, run_upload
+
+BODY_SIZE = 8 * 1024 * 1024
+
+
+class BytesHandler(BaseHTTPRequestHandler):
+    """Serves GET /<n> with an n-byte body"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        size = int(self.path.strip('/'))
+        self.send_response(200)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        chunk = bytes(64 * 1024)
+        while size > 0:
+            self.wfile.write(chunk[:size])
+            size -= len(chunk)
+
+
+@pytest.fixture
+def sink():
+    server = SinkServer('127.0.0.1', 0).start()
+    yield 'http://%s:%d/' % server.address
+    server.stop()
+
+
+@pytest.fixture
+def source():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BytesHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://%s:%d/' % server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def test_upload_to_sink(sink):
+    result = run_upload(sink, BODY_SIZE, connections=3)
+    assert result['bytes'] == BODY_SIZE and result['complete']
+    assert result['connections'] == 3 and result['mbps'] > 0
+
+
+def test_sink_replies_with_the_byte_count(sink):
+    response = http_speed.get_session().post(sink, data=b'x' * 1000)
+    assert response.status_code == 200 and response.text == '1000'
+
+
+def test_upload_cut_short(sink):
+    result = run_upload(sink, 64 * 1024 ** 3, max_seconds=0.5, interval=0.25)
+    assert not result['complete']
+    assert 0 < result['bytes'] < 64 * 1024 ** 3
+    assert result['intervals']
+
+
+def test_download(source):
+    result = run_download(source + str(BODY_SIZE), connections=2)
+    assert result['bytes'] == 2 * BODY_SIZE
+    assert result['mbps'] > 0 and result['ttfb'] >= 0
+
+
+def test_download_errors_raise(source):
+    with pytest.raises(Exception):
+        run_download(source + 'not-a-size')
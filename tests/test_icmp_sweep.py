@@ -0,0 +1,137 @@
+"""
+Loopback tests for the batched ICMP prober and its resolver cache
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from icmp_sweep import HostResolver, IcmpProber, fit_serialization_delay
+
+
+@pytest.fixture
+def prober():
+    try:
+        prober = IcmpProber()
+    except OSError as e:
+        pytest.skip(f"ICMP sockets not allowed here: {e}")
+    yield prober
+    prober.close()
+
+
+def test_sweep_loopback(prober):
+    rtts = prober.sweep(['127.0.0.1'], timeout=1.0)
+    assert rtts['127.0.0.1'] is not None and rtts['127.0.0.1'] >= 0
+
+
+def test_sweep_counts_and_sizes(prober):
+    rtts = prober.sweep(['127.0.0.1'], timeout=1.0, payload_size=512, count=3)['127.0.0.1']
+    assert len(rtts) == 3 and all(rtt is not None for rtt in rtts)
+    samples = prober.size_sweep('127.0.0.1', (56, 1024), timeout=1.0, count=2)
+    assert set(samples) == {56, 1024}
+
+
+def test_sweep_never_resolves_under_the_lock(prober, monkeypatch):
+    lookups = []
+    release = threading.Event()
+
+    def slow_lookup(host):
+        lookups.append(host)
+        release.wait(5)
+        return '127.0.0.1'
+
+    monkeypatch.setattr(socket, 'gethostbyname', slow_lookup)
+    started = time.perf_counter()
+    rtts = prober.sweep(['127.0.0.1', 'slow.example'], timeout=0.5)
+    assert time.perf_counter() - started < 2
+    # The uncached name counts as lost this sweep while it resolves in the background
+    assert rtts['slow.example'] is None and rtts['127.0.0.1'] is not None
+    release.set()
+    for _ in range(100):
+        if prober.resolver.entries.get('slow.example', (None,))[0]:
+            break
+        time.sleep(0.01)
+    assert prober.sweep(['slow.example'], timeout=1.0)['slow.example'] is not None
+    assert lookups == ['slow.example']
+
+
+def test_resolver_caches_failures(monkeypatch):
+    lookups = []
+
+    def failing_lookup(host):
+        lookups.append(host)
+        raise socket.gaierror('no such host')
+
+    monkeypatch.setattr(socket, 'gethostbyname', failing_lookup)
+    resolver = HostResolver(ttl=60, negative_ttl=60)
+    assert resolver.refresh(['dead.example', '192.0.2.1']) == {'dead.example': None, '192.0.2.1': '192.0.2.1'}
+    assert resolver.lookup('dead.example') is None
+    assert lookups == ['dead.example']
+
+
+def test_resolver_refreshes_expired_entries(monkeypatch):
+    answers = iter(['192.0.2.1', '192.0.2.2'])
+    monkeypatch.setattr(socket, 'gethostbyname', lambda host: next(answers))
+    resolver = HostResolver(ttl=0, negative_ttl=0)
+    assert resolver.refresh(['moving.example']) == {'moving.example': '192.0.2.1'}
+    # Expired: the stale address is served while the refresh runs
+    assert resolver.lookup('moving.example') == '192.0.2.1'
+    for _ in range(100):
+        if resolver.entries['moving.example'][0] == '192.0.2.2':
+            break
+        time.sleep(0.01)
+    assert resolver.entries['moving.example'][0] == '192.0.2.2'
+
+
+def test_fit_serialization_delay():
+    # 0.008 us per byte out and back: 1000 Mbps
+    samples = {size: [1.0 + size * 0.000008, None] for size in (56, 512, 1472)}
+    fit = fit_serialization_delay(samples)
+    assert fit['bottleneck_mbps'] == pytest.approx(1000, rel=0.01)
+    assert fit_serialization_delay({56: [1.0], 512: [None]}) is None
+
+
+def test_fallback_probes_only_fill_idle_workers(monkeypatch):
+    import app
+
+    release = threading.Event()
+
+    def slow_ping(host, timeout=3):
+        release.wait(5)
+        return 5.0
+
+    monkeypatch.setattr(app, 'icmp_prober', None)
+    monkeypatch.setattr(app, 'PROBE_WORKERS', 2)
+    monkeypatch.setattr(app, 'ping_host', slow_ping)
+    monkeypatch.setattr(app, 'probes_in_flight', {})
+    try:
+        targets = {'edge': 'h3', 'gateway': 'h1', 'dns': 'h2', 'alias': 'h1'}
+        # Two workers go to the gateway and DNS; h3 isn't submitted, so it isn't reported at all
+        assert app.run_probes(targets, 0.1) == {'gateway': None, 'dns': None, 'alias': None}
+        release.set()
+        for future in list(app.probes_in_flight.values()):
+            future.result(5)
+    finally:
+        release.set()
+
+
+def test_fallback_probes_rotate_through_targets(monkeypatch):
+    import app
+
+    monkeypatch.setattr(app, 'icmp_prober', None)
+    monkeypatch.setattr(app, 'PROBE_WORKERS', 4)
+    monkeypatch.setattr(app, 'ping_host', lambda host, timeout=3: 5.0)
+    monkeypatch.setattr(app, 'probes_in_flight', {})
+    extra = [f'192.0.2.{n}' for n in range(1, 8)]
+    targets = dict({host: host for host in extra}, gateway='gw', dns='ns')
+
+    probed = set()
+    for _ in range(4):
+        results = app.run_probes(targets, 2)
+        # Gateway and DNS are probed every tick, the extras take turns with the rest
+        assert results['gateway'] == results['dns'] == 5.0
+        assert len(results) == 4
+        probed.update(results)
+    assert probed >= set(extra)
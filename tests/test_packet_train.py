@@ -0,0 +1,79 @@
+"""
+Loopback tests for the packet-train server and client
+"""
+
+import socket
+import time
+
+import pytest
+
+import packet_train
+from packet_train import (COOKIE, COOKIE_BODY, HEADER, MAGIC, REQUEST, VERSION, BandwidthTracker,
+                          TrainServer, run_train)
+
+
+@pytest.fixture
+def server():
+    server = TrainServer('127.0.0.1', 0).start()
+    yield server
+    server.stop()
+
+
+def test_trains_both_directions(server):
+    host, port = server.address
+    for direction in ('download', 'upload'):
+        result = run_train(host, port, direction, count=16, size=1000)
+        assert result is not None and result['direction'] == direction
+        assert result['received'] == 16 and result['mbps'] > 0
+        time.sleep(packet_train.REQUEST_INTERVAL)
+
+
+def test_request_rate_limit(server):
+    host, port = server.address
+    assert run_train(host, port, 'download', count=8) is not None
+    # Too soon after the last train for this client
+    assert run_train(host, port, 'download', count=8, timeout=0.3) is None
+    time.sleep(packet_train.REQUEST_INTERVAL)
+    assert run_train(host, port, 'download', count=8) is not None
+
+
+def test_global_send_cap():
+    server = TrainServer('127.0.0.1', 0, max_send_rate=1).start()
+    try:
+        host, port = server.address
+        # The bucket starts one maximal train deep and barely refills
+        assert run_train(host, port, 'download', count=128, size=1472) is not None
+        time.sleep(packet_train.REQUEST_INTERVAL)
+        assert run_train(host, port, 'download', count=8, timeout=0.3) is None
+    finally:
+        server.stop()
+
+
+def test_request_without_cookie_gets_only_a_cookie(server):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(0.5)
+    try:
+        sock.connect(server.address)
+        request = HEADER.pack(MAGIC, VERSION, REQUEST, 7, 1472, 128) + bytes(COOKIE_BODY.size)
+        sock.send(request)
+        reply = sock.recv(65535)
+        assert len(reply) <= len(request)
+        assert HEADER.unpack_from(reply)[2] == COOKIE
+        # A forged cookie gets another cookie, not a train
+        sock.send(request[:HEADER.size] + b'forged!!')
+        assert HEADER.unpack_from(sock.recv(65535))[2] == COOKIE
+        # Unpadded requests get nothing
+        sock.send(request[:HEADER.size])
+        with pytest.raises(socket.timeout):
+            sock.recv(65535)
+    finally:
+        sock.close()
+
+
+def test_bandwidth_tracker_calibration():
+    tracker = BandwidthTracker(window=3)
+    for mbps in (10, 20, 30):
+        tracker.add({'direction': 'download', 'mbps': mbps, 'loss_percent': 0})
+    assert tracker.calibrate('download', 40)
+    assert tracker.estimate()['download']['mbps'] == 40
+    assert not tracker.calibrate('upload', 40)
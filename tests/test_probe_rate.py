@@ -0,0 +1,32 @@
+"""
+Tests for the adaptive probe rate and per-target packet budgets
+"""
+
+from probe_rate import ProbeRateController
+
+
+def test_budget_is_only_spent_on_probed_hosts():
+    controller = ProbeRateController(default_pps=1)
+    targets = {'gateway': 'gw', 'edge': 'edge'}
+    assert controller.due_targets(targets, 0) == targets
+    # Only the gateway got a probe out; the edge stays due
+    controller.observe({'gw': 5.0}, 0.2, probed_at=0)
+    assert controller.due_targets(targets, 0.5) == {'edge': 'edge'}
+    assert controller.due_targets(targets, 1.0) == targets
+
+
+def test_lost_target_forgets_its_rtt():
+    controller = ProbeRateController()
+    controller.observe({'gw': 5.0}, 0)
+    assert controller.latest('gw') == 5.0
+    controller.observe({'gw': None}, 1)
+    assert controller.latest('gw') is None
+    assert controller.status()['last_event']['reason'] == 'loss from gw'
+
+
+def test_latency_jump_speeds_up_and_calm_backs_off():
+    controller = ProbeRateController(initial_interval=5, min_interval=0.5, max_interval=10, hold=30)
+    for now in range(5):
+        controller.observe({'gw': 20.0}, now)
+    assert controller.observe({'gw': 200.0}, 5) == 0.5
+    assert controller.observe({'gw': 20.0}, 40) == 0.75
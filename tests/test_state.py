@@ -0,0 +1,148 @@
+"""
+Concurrency tests for the copy-on-write state and the status snapshots
+Many writer threads hammer StateStore.update (directly and through
+app.update_state) while readers publish and build payloads
+"""
+
+import queue
+import threading
+
+import pytest
+
+import app
+from state import StateStore
+
+WRITERS = 8
+UPDATES = 300
+INTERFACE = 'test0'
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_concurrent_updates_lose_nothing():
+    store = StateStore({'counter': 0})
+    seen = []
+    done = threading.Event()
+
+    def writer(index):
+        for n in range(UPDATES):
+            store.update(lambda data: {'counter': data['counter'] + 1, f'writer{index}': n})
+
+    def reader():
+        while not done.is_set():
+            seen.append(store.current.version)
+
+    reader_thread = threading.Thread(target=reader)
+    reader_thread.start()
+    run_threads([lambda index=index: writer(index) for index in range(WRITERS)])
+    done.set()
+    reader_thread.join()
+
+    state = store.current
+    assert state['counter'] == WRITERS * UPDATES
+    assert state.version == WRITERS * UPDATES
+    assert all(state[f'writer{index}'] == UPDATES - 1 for index in range(WRITERS))
+    assert seen == sorted(seen)
+
+
+def test_unchanged_fields_keep_the_version():
+    store = StateStore({'a': 1, 'b': [1]})
+    assert store.update({'a': 1, 'b': [1]}).version == 0
+    state = store.update({'a': 2})
+    assert state.version == 1
+    assert state.changed_since(0) == {'a': 2}
+
+
+@pytest.fixture
+def fresh_state():
+    """Swap in a fresh state store and history for the selected interface"""
+    saved = app.monitoring_state, app.status_snapshot
+    app.monitoring_state = StateStore(dict(app.initial_state, selected_interface=INTERFACE, counter=0))
+    app.status_snapshot = None
+    app.interface_histories.pop(INTERFACE, None)
+    yield
+    app.monitoring_state, app.status_snapshot = saved
+    app.interface_histories.pop(INTERFACE, None)
+
+
+def test_publish_and_payloads_never_go_backwards(fresh_state):
+    subscriber = app.broadcaster.subscribe()
+    subscriber.messages = queue.Queue()  # Unbounded so the test can't be dropped as slow
+    done = threading.Event()
+    errors = []
+    bandwidth = {'rx_mbps': 1.0, 'tx_mbps': 2.0}
+
+    def apply_sample(state):
+        interfaces = dict(state['interfaces'])
+        interfaces[INTERFACE] = app.update_interface_state(
+            interfaces.get(INTERFACE), INTERFACE, True, 'ok', True, bandwidth, 10.0, 0.0
+        )
+        return {'interfaces': interfaces, 'counter': state['counter'] + 1}
+
+    def writer():
+        for _ in range(UPDATES):
+            app.update_state(apply_sample)
+
+    def reader():
+        last_version = last_cursor = 0
+        while not done.is_set():
+            try:
+                snapshot = app.publish_state()
+                payload = app.build_status_payload(app.monitoring_state.current)
+                for version, cursor in ((snapshot.version, snapshot.history_cursor),
+                                        (payload['version'], payload['history_cursor'])):
+                    assert version >= last_version and cursor >= last_cursor
+                # Every sample the payload's cursor covers is already in the buffer
+                assert len(payload['performance_history']) == min(payload['history_cursor'],
+                                                                  app.HISTORY_API_ENTRIES)
+                last_version, last_cursor = snapshot.version, snapshot.history_cursor
+            except AssertionError as e:
+                errors.append(e)
+                return
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in readers:
+        thread.start()
+    try:
+        run_threads([writer] * WRITERS)
+    finally:
+        done.set()
+        for thread in readers:
+            thread.join()
+        app.broadcaster.unsubscribe(subscriber)
+
+    assert not errors, errors[0]
+    state = app.monitoring_state.current
+    assert state['counter'] == WRITERS * UPDATES
+    assert state['interfaces'][INTERFACE]['history_cursor'] == WRITERS * UPDATES
+    assert app.publish_state().version == state.version
+
+    # Deltas reach subscribers in version order
+    ids = []
+    while not subscriber.messages.empty():
+        message = subscriber.messages.get_nowait()
+        ids.extend(int(line[4:]) for line in message.decode().split('\n') if line.startswith('id: '))
+    assert ids and ids == sorted(ids) and len(ids) == len(set(ids))
+
+
+def test_tokens_from_another_run_get_a_full_payload(fresh_state):
+    for _ in range(5):
+        app.update_state(lambda state: {'counter': state['counter'] + 1})
+    snapshot = app.publish_state()
+    client = app.app.test_client()
+
+    current = client.get(f'/api/status?since={snapshot.version - 1}&history_cursor=0&epoch={app.STATE_EPOCH}')
+    assert current.get_json()['full'] is False
+
+    # Same numbers from an earlier process run: a full payload, never a delta or a 304
+    stale = client.get(f'/api/status?since={snapshot.version - 1}&history_cursor=0&epoch=1')
+    assert stale.get_json()['full'] is True and stale.get_json()['epoch'] == app.STATE_EPOCH
+    assert client.get('/api/status', headers={'If-None-Match': f'W/"1-v{snapshot.version}"'}).status_code == 200
+    assert client.get('/api/status', headers={'If-None-Match': f'W/"{snapshot.etag}"'}).status_code == 304
@@ -0,0 +1,100 @@
+"""
+Loopback tests for the built-in TCP throughput server and client
+"""
+
+import socket
+import time
+
+import pytest
+
+import throughput
+from throughput import MAGIC, REQUEST, UPLOAD, VERSION, ThroughputServer, run_client
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(**options):
+        server = ThroughputServer('127.0.0.1', 0, **options).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def test_upload_and_download(make_server):
+    server = make_server()
+    host, port = server.address
+    for reverse in (False, True):
+        result = run_client(host, port, reverse=reverse, duration=1, tolerance=0, streams=2)
+        assert result['mbps'] > 0 and result['bytes'] > 0
+        assert result['streams'] == 2 and len(result['per_stream_mbps']) == 2
+        assert not result['converged']
+
+
+def test_download_limit_per_client(make_server):
+    server = make_server(download_limit=1)
+    host, port = server.address
+    assert run_client(host, port, reverse=True, duration=0.5, tolerance=0)['bytes'] > 0
+    # Over its budget the client's stream is closed before any data is sent
+    assert run_client(host, port, reverse=True, duration=0.5, tolerance=0)['bytes'] == 0
+    # Uploads aren't limited
+    assert run_client(host, port, duration=0.5, tolerance=0)['bytes'] > 0
+
+
+def test_handler_cap(make_server):
+    server = make_server(max_handlers=1)
+    busy = socket.create_connection(server.address)
+    try:
+        time.sleep(0.2)
+        extra = socket.create_connection(server.address)
+        extra.settimeout(2)
+        # Closed on accept while the only handler is taken
+        assert extra.recv(1) == b''
+        extra.close()
+    finally:
+        busy.close()
+    time.sleep(0.2)
+    assert run_client(*server.address, duration=0.5, tolerance=0)['bytes'] > 0
+
+
+def test_silent_client_times_out(make_server, monkeypatch):
+    monkeypatch.setattr(throughput, 'CONN_TIMEOUT', 0.3)
+    monkeypatch.setattr(throughput, 'UPLOAD_GRACE', 0.2)
+    server = make_server(max_handlers=1)
+    silent = socket.create_connection(server.address)
+    silent.settimeout(3)
+    started = time.perf_counter()
+    assert silent.recv(1) == b''
+    assert time.perf_counter() - started < 2
+    silent.close()
+
+    # A client that stalls mid-upload is dropped too, freeing the handler
+    stalled = socket.create_connection(server.address)
+    stalled.sendall(REQUEST.pack(MAGIC, VERSION, UPLOAD, 10) + bytes(1000))
+    stalled.settimeout(3)
+    assert stalled.recv(1) == b''
+    stalled.close()
+    assert run_client(*server.address, duration=0.5, tolerance=0)['bytes'] > 0
+
+    # Each byte arrives well within CONN_TIMEOUT, but the upload outlives its duration
+    trickler = socket.create_connection(server.address)
+    trickler.sendall(REQUEST.pack(MAGIC, VERSION, UPLOAD, 0.5))
+    trickler.settimeout(0.1)
+    started = time.perf_counter()
+    closed = False
+    while time.perf_counter() - started < 3 and not closed:
+        try:
+            trickler.sendall(b'x')
+            closed = trickler.recv(1) == b''
+        except socket.timeout:
+            pass
+        except OSError:
+            closed = True
+    trickler.close()
+    assert closed and time.perf_counter() - started < 2
+    time.sleep(0.2)
+    assert run_client(*server.address, duration=0.5, tolerance=0)['bytes'] > 0
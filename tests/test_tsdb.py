@@ -0,0 +1,40 @@
+"""
+Tests for the memory-mapped time-series store
+"""
+
+import os
+
+import pytest
+
+import tsdb
+from tsdb import TimeSeriesStore
+
+
+def open_descriptors():
+    return len(os.listdir('/proc/self/fd'))
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc to count descriptors")
+def test_old_segments_are_not_kept_open(tmp_path):
+    before = open_descriptors()
+    store = TimeSeriesStore(str(tmp_path), segment_seconds=1, probe_segment_records=16)
+    for second in range(100):
+        store.append_probe(1000.0 + second, 10.0, 20.0, 5.0)
+        store.append_probe(1000.5 + second, None, 20.0, 5.0)
+    assert len(store.probes.segments) == 100
+    assert open_descriptors() - before <= 2
+
+    records = list(store.probes.records(0, float('inf')))
+    assert len(records) == 200 and records[-1]['timestamp'] == 1099.5
+    assert open_descriptors() - before <= tsdb.MAX_MAPPED_SEGMENTS + 2
+    store.close()
+
+    # Reopened, only the newest segment is mapped
+    store = TimeSeriesStore(str(tmp_path), segment_seconds=1, probe_segment_records=16)
+    assert open_descriptors() - before <= 2
+    assert store.probes.last()['timestamp'] == 1099.5
+    assert len(list(store.probes.records(1050, 1060))) == 20
+    store.probes.append(1100.0, 1.0, 2.0, 3.0)
+    store.probes.expire(1090)
+    assert list(store.probes.records(0, 1090.5))[0]['timestamp'] == 1090.0
+    store.close()
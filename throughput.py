@@ -0,0 +1,375 @@
+"""
+Built-in TCP throughput engine
+A small server to run on our own endpoints and a client that measures
+upload or download against it. Data is sent with socket.sendfile (or
+memoryview slices) from one pre-filled pattern and received with recv_into
+a preallocated buffer, so no bytes objects are created per chunk.
+
+Run a server with: python throughput.py server [--port 5301]
+Measure with:      python throughput.py client HOST [--port 5301] [--reverse]
+"""
+
+import argparse
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+
+from iperf import ConvergenceDetector, window_mean
+
+DEFAULT_PORT = 5301
+MAGIC = b'SSTP'
+VERSION = 1
+UPLOAD = 0    # Client sends, server counts
+DOWNLOAD = 1  # Server sends, client counts
+REQUEST = struct.Struct('!4sBBxxd')  # magic, version, direction, duration seconds
+REPORT = struct.Struct('!Qd')  # Bytes received by the server, seconds it took
+PATTERN_SIZE = 4 * 1024 * 1024  # Pattern file sent over and over
+CHUNK_SIZE = 1024 * 1024  # Bytes per sendfile call / recv_into buffer
+SOCKET_BUFFER = 4 * 1024 * 1024
+CONN_TIMEOUT = 10  # Seconds a server connection may stall on a read or write
+MAX_HANDLERS = 32  # Test connections served at once; more are closed on accept
+DOWNLOAD_LIMIT = 32  # Download streams one client may start per DOWNLOAD_WINDOW
+DOWNLOAD_WINDOW = 60  # Seconds
+UPLOAD_GRACE = 5  # Seconds an upload may run past its duration before the server cuts it off
+
+
+class Pattern:
+    """Random (incompressible) payload sent over and over
+
+    Where os.sendfile exists the bytes go from an unlinked temporary file
+    straight to the socket; elsewhere they are sent from a memoryview of
+    one buffer. Either way offsets are explicit, so streams can share it.
+    """
+
+    def __init__(self, size=PATTERN_SIZE):
+        self.size = size
+        self.view = memoryview(os.urandom(size))
+        self.file = None
+        if hasattr(os, 'sendfile'):
+            self.file = tempfile.TemporaryFile()
+            self.file.write(self.view)
+            self.file.flush()
+
+    def send(self, sock, offset, count):
+        """Send up to ``count`` bytes from ``offset``; return the bytes sent"""
+        count = min(count, self.size - offset)
+        if self.file is not None:
+            return sock.sendfile(self.file, offset, count)
+        return sock.send(self.view[offset:offset + count])
+
+
+_pattern = None
+_pattern_lock = threading.Lock()
+
+
+def get_pattern():
+    """The process-wide payload pattern, created on first use"""
+    global _pattern
+    with _pattern_lock:
+        if _pattern is None:
+            _pattern = Pattern()
+        return _pattern
+
+
+def tune_socket(sock):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+        except OSError:
+            pass
+
+
+def recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("connection closed mid-message")
+        received += count
+    return bytes(buffer)
+
+
+def send_pattern(sock, pattern, stop, counter=None, index=0):
+    """Send the pattern over and over until ``stop`` is set; return bytes sent
+
+    ``counter[index]`` is kept up to date for live rate sampling.
+    """
+    sent = 0
+    offset = 0
+    while not stop.is_set():
+        count = pattern.send(sock, offset, CHUNK_SIZE)
+        if count == 0:
+            break
+        sent += count
+        offset = (offset + count) % pattern.size
+        if counter is not None:
+            counter[index] = sent
+    return sent
+
+
+def receive_all(sock, buffer, stop=None, counter=None, index=0):
+    """recv_into one preallocated buffer until EOF (or ``stop``); return bytes received"""
+    view = memoryview(buffer)
+    received = 0
+    while stop is None or not stop.is_set():
+        count = sock.recv_into(view)
+        if count == 0:
+            break
+        received += count
+        if counter is not None:
+            counter[index] = received
+    return received
+
+
+class ThroughputServer:
+    """Accepts test connections and sends or sinks data on each"""
+
+    def __init__(self, host='0.0.0.0', port=DEFAULT_PORT, max_duration=60, max_handlers=MAX_HANDLERS,
+                 download_limit=DOWNLOAD_LIMIT, download_window=DOWNLOAD_WINDOW):
+        self.host = host
+        self.port = port
+        self.max_duration = max_duration
+        self.pattern = get_pattern()
+        self.listener = None
+        self.thread = None
+        self.running = False
+        self.handlers = threading.BoundedSemaphore(max_handlers)
+        self.download_limit = download_limit
+        self.download_window = download_window
+        self.downloads = {}  # Client address -> start times of its recent download streams
+        self.downloads_lock = threading.Lock()
+
+    @property
+    def address(self):
+        return self.listener.getsockname()
+
+    def start(self):
+        """Bind and serve on a daemon thread"""
+        self.listener = socket.create_server((self.host, self.port))
+        self.running = True
+        self.thread = threading.Thread(target=self._accept, daemon=True, name='throughput-server')
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.listener is not None:
+            self.listener.close()
+
+    def _accept(self):
+        while self.running:
+            try:
+                conn, address = self.listener.accept()
+            except OSError:
+                break
+            if not self.handlers.acquire(blocking=False):
+                conn.close()  # At capacity
+                continue
+            threading.Thread(target=self._handle, args=(conn, address), daemon=True, name='throughput-conn').start()
+
+    def allow_download(self, client, now):
+        """Count a download stream against the client's budget; False once it is used up"""
+        with self.downloads_lock:
+            if len(self.downloads) > 1024:
+                self.downloads.clear()
+            starts = self.downloads.setdefault(client, deque())
+            while starts and now - starts[0] >= self.download_window:
+                starts.popleft()
+            if len(starts) >= self.download_limit:
+                return False
+            starts.append(now)
+            return True
+
+    def _handle(self, conn, address):
+        try:
+            # A stalled or silent client can't hold a handler forever
+            conn.settimeout(CONN_TIMEOUT)
+            tune_socket(conn)
+            magic, version, direction, duration = REQUEST.unpack(recv_exactly(conn, REQUEST.size))
+            if magic != MAGIC or version != VERSION:
+                return
+            duration = min(duration, self.max_duration)
+
+            # Stop after the duration, or earlier when the client hangs up
+            stop = threading.Event()
+            if direction == DOWNLOAD:
+                # Rate-limited so the server can't be used to flood someone
+                if not self.allow_download(address[0], time.monotonic()):
+                    print(f"Throughput server: download limit reached for {address[0]}")
+                    return
+                timer = threading.Timer(duration, stop.set)
+                timer.start()
+                try:
+                    send_pattern(conn, self.pattern, stop)
+                finally:
+                    timer.cancel()
+            else:
+                # A trickling client is cut off too, not just one that goes silent
+                def cut_off():
+                    stop.set()
+                    try:
+                        conn.shutdown(socket.SHUT_RD)  # Wakes the blocked recv
+                    except OSError:
+                        pass
+
+                timer = threading.Timer(duration + UPLOAD_GRACE, cut_off)
+                timer.start()
+                try:
+                    buffer = bytearray(CHUNK_SIZE)
+                    started = time.perf_counter()
+                    received = receive_all(conn, buffer, stop)
+                finally:
+                    timer.cancel()
+                if stop.is_set():
+                    return
+                conn.sendall(REPORT.pack(received, time.perf_counter() - started))
+        except OSError:
+            pass  # Client went away early (e.g. stopped on convergence) or timed out
+        finally:
+            conn.close()
+            self.handlers.release()
+
+
+def run_client(host, port=DEFAULT_PORT, reverse=False, duration=10, on_interval=None,
+               tolerance=0.05, window=3, streams=1, interval=1.0, connect_timeout=5):
+    """Measure throughput against a ThroughputServer
+
+    ``reverse`` measures download (server sends). Returns the same shape as
+    iperf.run_client: {'mbps', 'intervals', 'duration', 'converged',
+    'streams', 'per_stream_mbps', 'retransmits', 'bytes'}, or None when no
+    connection could be made.
+    """
+    sockets = []
+    try:
+        for _ in range(streams):
+            sock = socket.create_connection((host, port), timeout=connect_timeout)
+            sock.settimeout(duration + connect_timeout)
+            tune_socket(sock)
+            sock.sendall(REQUEST.pack(MAGIC, VERSION, DOWNLOAD if reverse else UPLOAD, duration))
+            sockets.append(sock)
+    except OSError as e:
+        print(f"Throughput client {host}:{port} connect error: {e}")
+        for sock in sockets:
+            sock.close()
+        return None
+
+    stop = threading.Event()
+    counters = [0] * streams  # Bytes moved so far per stream, written by the stream threads
+    reports = [None] * streams
+    pattern = None if reverse else get_pattern()
+
+    def run_stream(index, sock):
+        try:
+            if reverse:
+                receive_all(sock, bytearray(CHUNK_SIZE), stop, counters, index)
+            else:
+                send_pattern(sock, pattern, stop, counters, index)
+                sock.shutdown(socket.SHUT_WR)
+                reports[index] = REPORT.unpack(recv_exactly(sock, REPORT.size))
+        except OSError as e:
+            if not stop.is_set():
+                print(f"Throughput stream {index} to {host}:{port} error: {e}")
+
+    threads = [threading.Thread(target=run_stream, args=(index, sock), daemon=True)
+               for index, sock in enumerate(sockets)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    # Sample the counters once per interval on a fixed schedule
+    detector = ConvergenceDetector(window, tolerance)
+    intervals = []
+    per_stream = [[] for _ in range(streams)]
+    previous = [0] * streams
+    converged = False
+    tick = started
+    while any(thread.is_alive() for thread in threads):
+        tick += interval
+        if not reverse and tick - started > duration:
+            stop.set()  # The uploading side decides when the test ends
+        for thread in threads:
+            thread.join(max(0, tick - time.perf_counter()))
+        if time.perf_counter() < tick:
+            continue
+        current = list(counters)
+        deltas = [now - before for now, before in zip(current, previous)]
+        previous = current
+        for values, delta in zip(per_stream, deltas):
+            values.append(round(delta * 8 / interval / 1e6, 2))
+        sample = {
+            'start': round(tick - interval - started, 2),
+            'end': round(tick - started, 2),
+            'mbps': round(sum(deltas) * 8 / interval / 1e6, 2)
+        }
+        intervals.append(sample)
+        if on_interval is not None:
+            on_interval(sample)
+        if tolerance and not stop.is_set() and detector.add(sample['mbps']):
+            converged = True
+            stop.set()
+            if reverse:
+                # Closing the receiving side makes the server's sendfile fail and stop
+                for sock in sockets:
+                    sock.shutdown(socket.SHUT_RDWR)
+
+    elapsed = time.perf_counter() - started
+    for sock in sockets:
+        sock.close()
+
+    total = sum(counters)
+    if converged:
+        mbps = detector.estimate()
+    elif not reverse and all(report is not None for report in reports):
+        # What the server actually received, over the server's own clock
+        mbps = sum(received * 8 / seconds / 1e6 for received, seconds in reports if seconds > 0)
+    else:
+        mbps = total * 8 / elapsed / 1e6 if elapsed > 0 else 0.0
+    return {
+        'mbps': round(mbps, 2),
+        'intervals': intervals,
+        'duration': round(elapsed, 2),
+        'converged': converged,
+        'streams': streams,
+        'per_stream_mbps': [window_mean(values, window) for values in per_stream],
+        'retransmits': None,
+        'bytes': total
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Built-in TCP throughput test")
+    subparsers = parser.add_subparsers(dest='mode', required=True)
+    server_parser = subparsers.add_parser('server', help="Serve throughput tests")
+    server_parser.add_argument('--host', default='0.0.0.0')
+    server_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    client_parser = subparsers.add_parser('client', help="Measure against a server")
+    client_parser.add_argument('host')
+    client_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    client_parser.add_argument('--reverse', action='store_true', help="Measure download instead of upload")
+    client_parser.add_argument('--time', type=float, default=10)
+    client_parser.add_argument('--parallel', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.mode == 'server':
+        server = ThroughputServer(args.host, args.port).start()
+        print(f"Throughput server listening on {server.address[0]}:{server.address[1]}")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        result = run_client(args.host, args.port, args.reverse, args.time, streams=args.parallel,
+                            on_interval=lambda sample: print(f"{sample['start']:6.2f}-{sample['end']:6.2f} s  {sample['mbps']:10.2f} Mbps"))
+        print(result and f"{'Download' if args.reverse else 'Upload'}: {result['mbps']:.2f} Mbps"
+              f" ({result['bytes']} bytes in {result['duration']} s, converged={result['converged']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""
+Append-only memory-mapped time-series store
+Samples are fixed-width records in preallocated segment files that rotate
+by time, so history survives restarts without parsing anything on startup.
+Only the segment being written stays mapped; older ones are mapped when
+read and a few recently read ones are kept, so open descriptors stay
+bounded however long the retention
+"""
+
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+MAGIC = b'SSTSDB01'
+HEADER = struct.Struct('<8sIId')  # magic, record size, capacity, segment start
+HEADER_SIZE = 32
+MAX_MAPPED_SEGMENTS = 8  # Older segments per series kept mapped after a read
+
+
+class Segment:
+    """One memory-mapped segment file of fixed-width records
+
+    Records are written payload first and timestamp last, and unused slots
+    are zero, so the occupied prefix ends at the first zero timestamp. A
+    record torn by a crash keeps a zero timestamp and is simply reused.
+    """
+
+    def __init__(self, path, record, capacity=None, start=None):
+        self.path = path
+        self.record = record
+        self.mm = None
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, record.size, capacity, start).ljust(HEADER_SIZE, b'\x00'))
+                f.truncate(HEADER_SIZE + record.size * capacity)  # Sparse preallocation
+
+        self.map()
+        magic, record_size, self.capacity, self.start = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or record_size != record.size:
+            self.close()
+            raise ValueError(f"{path} is not a segment for this series")
+        self.count = self._find_end()
+
+    def map(self):
+        """Map the file unless it is mapped already; return the segment"""
+        if self.mm is None:
+            with open(self.path, 'r+b') as f:
+                self.mm = mmap.mmap(f.fileno(), 0)  # The map holds its own descriptor
+        return self
+
+    def unmap(self):
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:
+                pass  # A reader still holds a view; the map is released with it
+            self.mm = None
+
+    def timestamp_at(self, index):
+        return struct.unpack_from('<d', self.mm, HEADER_SIZE + index * self.record.size)[0]
+
+    def _find_end(self):
+        """Binary search for the first empty slot"""
+        lo, hi = 0, self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp_at(mid) > 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def full(self):
+        return self.count >= self.capacity
+
+    def last_timestamp(self):
+        return self.timestamp_at(self.count - 1) if self.count else 0.0
+
+    def append(self, values):
+        """Write one record (values[0] is the timestamp)"""
+        offset = HEADER_SIZE + self.count * self.record.size
+        packed = self.record.pack(*values)
+        self.mm[offset + 8:offset + self.record.size] = packed[8:]
+        self.mm[offset:offset + 8] = packed[:8]
+        self.count += 1
+
+    def bisect(self, timestamp):
+        """Index of the first record at or after timestamp"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def view(self, lo, hi):
+        """Zero-copy view of records lo..hi"""
+        size = self.record.size
+        return memoryview(self.mm)[HEADER_SIZE + lo * size:HEADER_SIZE + hi * size]
+
+    def flush(self):
+        if self.mm is not None:
+            self.mm.flush()
+
+    def close(self):
+        self.unmap()
+
+
+class Series:
+    """Time-rotated sequence of segments holding one record layout"""
+
+    def __init__(self, directory, name, fields, segment_seconds, segment_records):
+        if fields[0] != ('timestamp', 'd'):
+            raise ValueError("the first field must be a 'd' timestamp")
+        self.directory = directory
+        self.name = name
+        self.fields = [field for field, _ in fields]
+        self.record = struct.Struct('<' + ''.join(fmt for _, fmt in fields))
+        self.segment_seconds = segment_seconds
+        self.segment_records = segment_records
+        self.lock = threading.Lock()
+        self.segments = []
+        self.mapped = OrderedDict()  # Older segments still mapped, least recently read first
+
+        # Find existing segments in start order; nothing is parsed and only the newest stays mapped
+        prefix = f'{name}-'
+        for filename in sorted(os.listdir(directory)):
+            if filename.startswith(prefix) and filename.endswith('.seg'):
+                try:
+                    segment = Segment(os.path.join(directory, filename), self.record)
+                except (ValueError, OSError) as e:
+                    print(f"Skipping segment {filename}: {e}")
+                    continue
+                segment.unmap()
+                self.segments.append(segment)
+        self.segments.sort(key=lambda segment: segment.start)
+        if self.segments:
+            self.segments[-1].map()
+
+    def _mapped(self, segment):
+        """Map a segment for reading, keeping only the most recently read older ones"""
+        segment.map()
+        if segment is self.segments[-1]:
+            return segment
+        self.mapped[segment] = None
+        self.mapped.move_to_end(segment)
+        while len(self.mapped) > MAX_MAPPED_SEGMENTS:
+            self.mapped.popitem(last=False)[0].unmap()
+        return segment
+
+    def _window(self, timestamp):
+        return math.floor(timestamp / self.segment_seconds)
+
+    def _active_segment(self, timestamp):
+        segment = self.segments[-1] if self.segments else None
+        if segment is None or segment.full() or self._window(timestamp) != self._window(segment.start):
+            if segment is not None:
+                segment.flush()
+                segment.unmap()  # Mapped again only when read
+            filename = f'{self.name}-{int(timestamp * 1000):015d}.seg'
+            segment = Segment(os.path.join(self.directory, filename), self.record,
+                              self.segment_records, timestamp)
+            self.segments.append(segment)
+        return segment
+
+    def append(self, timestamp, *values):
+        """Append one record; timestamps never go backwards within a series"""
+        with self.lock:
+            if self.segments:
+                # Clamp clock steps so every segment stays sorted for bisect
+                timestamp = max(timestamp, self.segments[-1].last_timestamp())
+            self._active_segment(timestamp).append((timestamp,) + values)
+
+    def range(self, start, end):
+        """Zero-copy views of the records with start <= timestamp < end"""
+        views = []
+        with self.lock:
+            segments = self.segments
+            for index, segment in enumerate(segments):
+                next_start = segments[index + 1].start if index + 1 < len(segments) else math.inf
+                if next_start <= start or segment.start >= end or not segment.count:
+                    continue
+                self._mapped(segment)
+                lo, hi = segment.bisect(start), segment.bisect(end)
+                if hi > lo:
+                    views.append(segment.view(lo, hi))
+        return views
+
+    def decode(self, view):
+        """Decode the records of a view into dicts"""
+        for values in self.record.iter_unpack(view):
+            yield {
+                field: value.rstrip(b'\x00').decode() if isinstance(value, bytes) else value
+                for field, value in zip(self.fields, values)
+            }
+
+    def records(self, start, end):
+        """Decode a time range into dicts"""
+        for view in self.range(start, end):
+            yield from self.decode(view)
+
+    def last(self):
+        """Decode the newest record, or None when the series is empty"""
+        with self.lock:
+            for segment in reversed(self.segments):
+                if segment.count:
+                    view = self._mapped(segment).view(segment.count - 1, segment.count)
+                    return next(self.decode(view))
+        return None
+
+    def expire(self, before):
+        """Delete segments whose records are all older than before"""
+        with self.lock:
+            while len(self.segments) > 1 and self.segments[1].start <= before:
+                segment = self.segments.pop(0)
+                self.mapped.pop(segment, None)
+                segment.close()
+                try:
+                    os.remove(segment.path)
+                except OSError as e:
+                    print(f"Could not remove expired segment {segment.path}: {e}")
+
+    def flush(self):
+        with self.lock:
+            if self.segments:
+                self.segments[-1].flush()
+
+    def close(self):
+        with self.lock:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+            self.mapped.clear()
+
+
+class TimeSeriesStore:
+    """On-disk store for probe samples and speed-test results"""
+
+    def __init__(self, directory, segment_seconds=3600, probe_segment_records=36000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.probes = Series(directory, 'probe', [
+            ('timestamp', 'd'),
+            ('latency', 'd'),      # Gateway latency in ms, NaN when lost or not probed that tick
+            ('dns_latency', 'd'),  # DNS latency in ms, NaN when lost or not probed that tick
+            ('bandwidth', 'd'),
+        ], segment_seconds, probe_segment_records)
+        self.speed_tests = Series(directory, 'speedtest', [
+            ('timestamp', 'd'),
+            ('download_mbps', 'd'),
+            ('upload_mbps', 'd'),
+            ('duration', 'd'),
+            ('method', '16s'),
+        ], 30 * 24 * 3600, 4096)
+        self.rollups = {}
+        self.rollups_lock = threading.Lock()
+
+    def append_probe(self, timestamp, latency, dns_latency, bandwidth):
+        """Record one monitoring tick"""
+        self.probes.append(
+            timestamp,
+            math.nan if latency is None else latency,
+            math.nan if dns_latency is None else dns_latency,
+            bandwidth
+        )
+
+    def append_speed_test(self, timestamp, result):
+        """Record one speed-test result that carries throughput numbers"""
+        self.speed_tests.append(
+            timestamp,
+            float(result.get('download_mbps') or 0),
+            float(result.get('upload_mbps') or 0),
+            float(result.get('duration') or 0),
+            str(result.get('method', '')).encode()[:16]
+        )
+
+    def rollup_series(self, metric, resolution):
+        """Get the series holding closed rollup buckets for one metric and tier"""
+        with self.rollups_lock:
+            series = self.rollups.get((metric, resolution))
+            if series is None:
+                series = Series(self.directory, f'rollup_{metric}_{resolution}', [
+                    ('timestamp', 'd'),  # Bucket start
+                    ('count', 'I'),
+                    ('loss', 'I'),
+                    ('min', 'd'),
+                    ('max', 'd'),
+                    ('sum', 'd'),
+                    ('p50', 'd'),  # Percentiles are NaN for metrics without a sketch
+                    ('p90', 'd'),
+                    ('p99', 'd'),
+                    ('p99_9', 'd'),
+                ], 30 * 24 * 3600, 50000)
+                self.rollups[(metric, resolution)] = series
+            return series
+
+    def append_rollup(self, metric, resolution, row):
+        """Record one closed (start, count, loss, min, max, sum, p50, p90, p99, p99_9) bucket"""
+        self.rollup_series(metric, resolution).append(*row)
+
+    def load_rollups(self, metric, resolution, start):
+        """Read closed buckets since start as row tuples"""
+        series = self.rollup_series(metric, resolution)
+        return [tuple(record.values()) for record in series.records(start, math.inf)]
+
+    def _all_series(self):
+        with self.rollups_lock:
+            return [self.probes, self.speed_tests] + list(self.rollups.values())
+
+    def flush(self):
+        for series in self._all_series():
+            series.flush()
+
+    def close(self):
+        for series in self._all_series():
+            series.close()